@@ -0,0 +1,179 @@
+import contextvars
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from werkzeug.exceptions import TooManyRequests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BATCH = 1
+
+SHED = metrics.REGISTRY.counter('localcleric_shed_total', 'LLM-bound requests shed by admission control', ('reason',))
+
+_priority = contextvars.ContextVar('localcleric_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level):
+    """Run a block with the given admission priority (lower is served first)"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class Overloaded(TooManyRequests):
+    """Raised when admission control sheds a request; carries a Retry-After hint"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Too many requests ({reason}), retry after {retry_after}s", retry_after=retry_after)
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ('key', 'granted', 'shed')
+
+    def __init__(self, key):
+        self.key = key  # (priority, deadline, arrival)
+        self.granted = False
+        self.shed = None
+
+
+class AdmissionController:
+    """Admission for LLM-bound work: per-user token buckets and a global concurrency limit
+
+    Each user's bucket refills at rate tokens per second up to burst. Batch
+    work skips the buckets, since replays send many items for one user and the
+    batch pool already caps them. Requests then need one of max_concurrent
+    slots; when all are busy they wait in a small priority queue (interactive
+    before batch, earliest deadline first). A waiter is shed with 429 when the queue is full of more important
+    work, when its estimated wait exceeds queue_timeout, or when the timeout
+    passes before a slot frees up.
+    """
+
+    def __init__(self, rate=0.5, burst=5, max_concurrent=8, max_queue=32, queue_timeout=5.0, max_users=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_users = max_users
+        self._buckets = OrderedDict()  # user_id -> (tokens, updated_at)
+        self._queue = []
+        self._active = 0
+        self._service_time = 1.0  # EWMA of seconds a slot is held
+        self._arrivals = itertools.count()
+        self._cond = threading.Condition()
+        self.admitted = 0
+        self.queued = 0
+        self.shed = {}
+
+    @contextmanager
+    def admit(self, user_id):
+        """Hold a slot for one LLM-bound call; raises Overloaded instead of waiting too long"""
+        if _priority.get() != BATCH:
+            self._take_token(user_id)
+        self._acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    def _take_token(self, user_id):
+        now = time.monotonic()
+        with self._cond:
+            tokens, updated_at = self._buckets.pop(user_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[user_id] = (tokens - 1 if allowed else tokens, now)
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+            if allowed:
+                return
+            self._count_shed('rate_limited')
+        raise Overloaded('rate_limited', math.ceil((1 - tokens) / self.rate))
+
+    def _retry_after(self):
+        return max(1, math.ceil(self._service_time * (len(self._queue) + 1) / self.max_concurrent))
+
+    def _count_shed(self, reason):
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+        SHED.inc(reason)
+
+    def _acquire(self):
+        with self._cond:
+            if self._active < self.max_concurrent and not self._queue:
+                self._active += 1
+                self.admitted += 1
+                return
+
+            # Don't queue work that would not get a slot before its deadline anyway
+            estimated_wait = self._service_time * (len(self._queue) + 1) / self.max_concurrent
+            if estimated_wait > self.queue_timeout:
+                self._count_shed('deadline')
+                raise Overloaded('deadline', self._retry_after())
+
+            waiter = _Waiter((_priority.get(), time.monotonic() + self.queue_timeout, next(self._arrivals)))
+            if len(self._queue) >= self.max_queue:
+                worst = max(self._queue, key=lambda queued: queued.key)
+                if worst.key[0] <= waiter.key[0]:
+                    self._count_shed('queue_full')
+                    raise Overloaded('queue_full', self._retry_after())
+                # Make room by dropping the least important waiter
+                self._queue.remove(worst)
+                worst.shed = 'preempted'
+                self._cond.notify_all()
+            self._queue.append(waiter)
+            self.queued += 1
+
+            while True:
+                if waiter.granted:
+                    return
+                if waiter.shed:
+                    self._count_shed(waiter.shed)
+                    raise Overloaded(waiter.shed, self._retry_after())
+                remaining = waiter.key[1] - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(waiter)
+                    self._count_shed('timeout')
+                    raise Overloaded('timeout', self._retry_after())
+                self._cond.wait(remaining)
+
+    def _release(self, held):
+        with self._cond:
+            self._service_time = 0.8 * self._service_time + 0.2 * held
+            self._active -= 1
+            now = time.monotonic()
+            while self._queue and self._active < self.max_concurrent:
+                waiter = min(self._queue, key=lambda queued: queued.key)
+                self._queue.remove(waiter)
+                if waiter.key[1] <= now:
+                    waiter.shed = 'timeout'
+                    continue
+                waiter.granted = True
+                self._active += 1
+                self.admitted += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': self._active,
+                'max_concurrent': self.max_concurrent,
+                'queue_depth': len(self._queue),
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'shed': dict(self.shed),
+                'service_time_ms': self._service_time * 1000,
+                'tracked_users': len(self._buckets),
+            }
@@ -1,10 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import json
 import os
 import logging
-from werkzeug.exceptions import BadRequest
-from chatbot import Chatbot
+import itertools
+import time
+from werkzeug.exceptions import BadRequest, TooManyRequests
+from chatbot import Chatbot, SYSTEM_PROMPT
+from symptom_index import SymptomIndex
+from places_client import PlacesClient, PLACES_API_URL
+from session_store import create_session_store
+from llm_cache import LLMCache
+from resilience import create_call_policy
+from batch import BatchRunner
+from admission import AdmissionController
+from calendar_service import SlotConflict, create_calendar_service
+from conversation import ConversationContext
+import metrics
 from datetime import datetime
 
 # Configure logging
@@ -17,7 +29,8 @@ CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
 try:
     # Load configuration
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(os.path.dirname(script_dir), 'config', 'api_keys.json')
+    config_path = os.environ.get('LOCALCLERIC_CONFIG',
+                                 os.path.join(os.path.dirname(script_dir), 'config', 'api_keys.json'))
     logger.info(f"Loading configuration from: {config_path}")
     
     with open(config_path) as f:
@@ -29,13 +42,95 @@ try:
     if not config.get('google_places', {}).get('api_key'):
         raise ValueError("Google Places API key not found in config")
     
+    # Map the compiled symptom index (built from the dataset CSV if missing or stale)
+    symptom_index = SymptomIndex.load_or_build()
+
+    # Deadlines, hedging and circuit breakers for outbound calls
+    resilience_config = config.get('resilience', {})
+
+    # Places client with a disk-backed result cache shared across restarts
+    places_config = config['google_places']
+    places_client = PlacesClient(
+        places_config['api_key'],
+        url=places_config.get('url', PLACES_API_URL),
+        timeout=places_config.get('timeout', 5),
+        cache_ttl=places_config.get('cache_ttl', 24 * 3600),
+        cache_path=places_config.get('cache_path', os.path.join(script_dir, 'cache', 'places_cache.json')),
+        policy=create_call_policy('places', resilience_config.get('places'), places_config.get('timeout', 5))
+    )
+
+    # Session store: in-memory by default, SQLite to share sessions between worker processes.
+    # A user's turns can reach any worker, so several workers must share the SQLite store.
+    sessions_config = dict(config.get('sessions', {}))
+    if os.environ.get('LOCALCLERIC_PREFORK') and int(os.environ.get('LOCALCLERIC_WORKERS', 1)) > 1:
+        if sessions_config.get('backend') == 'memory':
+            raise ValueError("In-memory sessions are per worker; use the sqlite session backend with multiple workers")
+        sessions_config.setdefault('backend', 'sqlite')
+    session_store = create_session_store(sessions_config, os.path.join(script_dir, 'cache', 'sessions.db'))
+
+    # Calendar: SQLite stand-in for the Firestore users/{uid}/events collections
+    calendar_service = create_calendar_service(config.get('calendar'), os.path.join(script_dir, 'cache', 'calendar.db'))
+
+    # Model response cache: in-memory LRU, plus a SQLite tier when a path is configured
+    llm_cache_config = config.get('llm_cache', {})
+    llm_cache = LLMCache(
+        max_entries=llm_cache_config.get('max_entries', 1024),
+        ttl=llm_cache_config.get('ttl', 7 * 24 * 3600),
+        path=llm_cache_config.get('path')
+    )
+
+    # Optional Gemini transport overrides, e.g. to point the SDK at a local stand-in server
+    gemini_config = config['gemini']
+    model_options = {}
+    if gemini_config.get('transport'):
+        model_options['transport'] = gemini_config['transport']
+    if gemini_config.get('api_endpoint'):
+        model_options['client_options'] = {'api_endpoint': gemini_config['api_endpoint']}
+
     # Initialize chatbot
-    chatbot = Chatbot(config['gemini']['api_key'], config['google_places']['api_key'])
+    chatbot = Chatbot(config['gemini']['api_key'], places_config['api_key'],
+                      symptom_index=symptom_index, places_client=places_client,
+                      session_store=session_store, llm_cache=llm_cache,
+                      model_policy=create_call_policy('gemini', resilience_config.get('gemini'), 15),
+                      batch_runner=BatchRunner(**config.get('batch', {})),
+                      admission=AdmissionController(**config.get('admission', {})),
+                      calendar=calendar_service,
+                      conversation=ConversationContext(SYSTEM_PROMPT, **config.get('conversation', {})),
+                      model_options=model_options)
+    if places_config.get('warm_up'):
+        # Under the pre-fork server, warm up synchronously so no thread is running at fork time
+        chatbot.warm_up_places(background=not os.environ.get('LOCALCLERIC_PREFORK'))
+    if config['gemini'].get('warm_up', True) and not os.environ.get('LOCALCLERIC_PREFORK'):
+        # Load the Gemini SDK off the request path; the pre-fork server does this per worker
+        chatbot.warm_up_model()
     
 except Exception as e:
     logger.error(f"Startup Error: {str(e)}")
     raise
 
+@app.before_request
+def start_timing():
+    g.timings = metrics.start_request()
+
+@app.after_request
+def record_timing(response):
+    timings = g.get('timings')
+    if timings is None:
+        return response
+    if not response.is_streamed:
+        response.headers['Server-Timing'] = metrics.server_timing(timings)
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    method, status = request.method, response.status_code
+
+    def observe():
+        # Runs once the body has been sent, so streamed responses are timed in full
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - timings.start, endpoint, method, status)
+        if status >= 500:
+            metrics.ERRORS.inc('request')
+
+    response.call_on_close(observe)
+    return response
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     try:
@@ -59,9 +154,167 @@ def chat():
     except BadRequest as e:
         logger.warning(f"Bad Request: {str(e)}")
         return jsonify({'error': str(e)}), 400
+    except TooManyRequests as e:
+        return shed_response(e)
     except Exception as e:
         logger.error(f"Unexpected Error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def shed_response(e):
+    """429 with a Retry-After hint for a request shed by admission control"""
+    logger.warning(f"Shed request: {str(e)}")
+    return jsonify({'error': str(e), 'retry_after': e.retry_after}), 429, {'Retry-After': str(e.retry_after)}
+
+def format_sse(event):
+    """Serialize one event payload in Server-Sent Events wire format"""
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    try:
+        logger.info("Received streaming chat request")
+
+        if not request.is_json:
+            logger.warning("Request is not JSON")
+            raise BadRequest("Request must be JSON")
+
+        events = chatbot.stream_chat_request(request.json)
+
+    except BadRequest as e:
+        logger.warning(f"Bad Request: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+    # Run the turn up to its first event here, so a shed request still gets a real 429
+    first = []
+    try:
+        first.append(next(events))
+    except StopIteration:
+        pass
+    except TooManyRequests as e:
+        return shed_response(e)
+    except Exception as e:
+        logger.error(f"Streaming Error: {str(e)}")
+        first.append({'event': 'error', 'data': {'error': str(e)}})
+
+    def generate():
+        try:
+            for event in itertools.chain(first, events):
+                yield format_sse(event)
+        except Exception as e:
+            logger.error(f"Streaming Error: {str(e)}")
+            yield format_sse({'event': 'error', 'data': {'error': str(e)}})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    try:
+        logger.info("Received batch chat request")
+
+        if not request.is_json:
+            logger.warning("Request is not JSON")
+            raise BadRequest("Request must be JSON")
+
+        results = chatbot.batch_chat_request(request.json)
+
+    except BadRequest as e:
+        logger.warning(f"Bad Request: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        for result in results:
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/calendar', methods=['GET'])
+def list_events():
+    try:
+        start, end = request.args.get('start'), request.args.get('end')
+        events = calendar_service.events(
+            request.args.get('user_id', 'default'),
+            calendar_service.parse_datetime(start, 'start') if start else None,
+            calendar_service.parse_datetime(end, 'end') if end else None)
+        return jsonify({'events': [event.to_dict() for event in events]})
+    except BadRequest as e:
+        logger.warning(f"Bad Request: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/calendar', methods=['POST'])
+def create_event():
+    try:
+        if not request.is_json:
+            raise BadRequest("Request must be JSON")
+        user_id = request.json.get('user_id', 'default')
+        event = calendar_service.parse_event(request.json)
+        event = calendar_service.add_event(user_id, event.title, event.start, event.end, event.ai_scheduled)
+        return jsonify({'event': event.to_dict()}), 201
+    except SlotConflict as e:
+        return jsonify({
+            'error': str(e),
+            'conflicts': [event.to_dict() for event in e.conflicts],
+            'suggestions': [datetime.fromtimestamp(start).isoformat() for start in e.suggestions]
+        }), 409
+    except BadRequest as e:
+        logger.warning(f"Bad Request: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/calendar/import', methods=['POST'])
+def import_events():
+    try:
+        if not request.is_json or not isinstance(request.json.get('events'), list):
+            raise BadRequest("Request must be JSON with an events array")
+        events = [calendar_service.parse_event(event) for event in request.json['events']]
+        count = calendar_service.bulk_load(request.json.get('user_id', 'default'), events)
+        return jsonify({'imported': count}), 201
+    except BadRequest as e:
+        logger.warning(f"Bad Request: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/calendar/<event_id>', methods=['DELETE'])
+def delete_event(event_id):
+    if calendar_service.delete_event(request.args.get('user_id', 'default'), event_id) is None:
+        return jsonify({'error': 'Event not found'}), 404
+    return jsonify({'deleted': event_id})
+
+@app.route('/api/calendar/free', methods=['GET'])
+def free_slots():
+    try:
+        after = request.args.get('after')
+        try:
+            count = min(int(request.args.get('count', 3)), 50)
+            duration = float(request.args['duration']) * 60 if 'duration' in request.args else None
+        except ValueError:
+            raise BadRequest("count and duration must be numbers")
+        if count < 1 or (duration is not None and duration <= 0):
+            raise BadRequest("count and duration must be positive")
+        slots = calendar_service.free_slots(
+            request.args.get('user_id', 'default'),
+            calendar_service.parse_datetime(after, 'after') if after else time.time(),
+            count, duration)
+        return jsonify({'slots': [datetime.fromtimestamp(start).isoformat() for start in slots]})
+    except BadRequest as e:
+        logger.warning(f"Bad Request: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    checks = chatbot.readiness()
+    ready = all(checks.values())
+    return jsonify({'status': 'ready' if ready else 'not ready', 'checks': checks}), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    return jsonify(chatbot.stats())
+
 if __name__ == '__main__':
     app.run(debug=True, port=5003)
\ No newline at end of file
@@ -0,0 +1,99 @@
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import BadRequest, HTTPException
+
+import admission
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRunner:
+    """Runs batches of chat items on a capped pool shared by all batch requests
+
+    Items are grouped by user: each user's items run in order on one pool
+    thread, since they share session state, while different users run
+    concurrently. Results are yielded as they complete, and an item's failure
+    is reported on that item only. Model calls made for batch items queue
+    behind interactive ones in admission control.
+    """
+
+    def __init__(self, max_workers=8, max_items=500):
+        self.max_workers = max_workers
+        self.max_items = max_items
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+
+    @property
+    def executor(self):
+        """Worker pool, recreated in each process since threads do not survive fork"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='batch')
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def validate(self, items):
+        """Check the batch and each item's shape, so a malformed batch is rejected before results stream"""
+        if not isinstance(items, list) or not items:
+            raise BadRequest("Batch must be a non-empty JSON array of {user_id, message} items")
+        if len(items) > self.max_items:
+            raise BadRequest(f"Batch is limited to {self.max_items} items")
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise BadRequest(f"Batch item {index} must be an object")
+            if not isinstance(item.get('user_id', 'default'), str):
+                raise BadRequest(f"Batch item {index}: user_id must be a string")
+            if not isinstance(item.get('message'), str) or not item['message']:
+                raise BadRequest(f"Batch item {index}: message is required")
+
+    def run(self, items, process):
+        """Yield one result dict per item, in completion order; process(item) handles a single item"""
+        self.validate(items)
+        by_user = {}
+        for index, item in enumerate(items):
+            by_user.setdefault(item.get('user_id', 'default'), []).append((index, item))
+
+        results = queue.Queue()
+        for user_items in by_user.values():
+            self.executor.submit(self._run_user, user_items, process, results)
+        with self._lock:
+            self.batches += 1
+            self.items += len(items)
+
+        for _ in range(len(items)):
+            yield results.get()
+
+    def _run_user(self, user_items, process, results):
+        for index, item in user_items:
+            try:
+                with admission.priority(admission.BATCH):
+                    response = process(item)
+                if isinstance(response, dict):
+                    result = {'response': response['text'], 'event_details': response.get('event_details')}
+                else:
+                    result = {'response': response}
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                status = e.code if isinstance(e, HTTPException) else 500
+                if status >= 500:
+                    logger.error(f"Batch item {index} failed: {str(e)}")
+                result = {'error': str(e), 'status': status}
+                if getattr(e, 'retry_after', None) is not None:
+                    result['retry_after'] = e.retry_after
+            result['index'] = index
+            result['user_id'] = item.get('user_id', 'default')
+            results.put(result)
+
+    def stats(self):
+        with self._lock:
+            return {'batches': self.batches, 'items': self.items, 'errors': self.errors}
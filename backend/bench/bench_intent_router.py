@@ -0,0 +1,82 @@
+"""Micro-benchmark: compiled intent router vs. the original chain of linear scans
+
+Usage: python bench/bench_intent_router.py [--number N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import IntentRouter  # noqa: E402
+
+MESSAGES = [
+    "hi",
+    "Hello, how are you?",
+    "I have headache and nausea, severity is 7",
+    "I know I have a high fever and chills",
+    "thanks, I also have a cough",
+    "nope, that's all",
+    "Can you find me a general physician?",
+    "I need a cardiologist near me",
+    "Schedule an appointment with them for 2:30 PM on 3/15/25",
+    "what should I do about my back pain that started after lifting boxes yesterday",
+    "goodbye",
+    "help",
+]
+
+GREETINGS = ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"]
+THANKS = ["thank you", "thanks", "appreciate it", "thank"]
+GOODBYES = ["bye", "goodbye", "see you", "see ya"]
+DONE = ['no', 'nope', "that's all", 'thats all', 'those are all']
+SPECIALISTS = [
+    "cardiologist", "neurologist", "dermatologist", "pediatrician",
+    "orthopedist", "gynecologist", "obstetrician", "psychiatrist",
+    "ophthalmologist", "urologist", "endocrinologist"
+]
+
+
+def legacy_classify(message):
+    """The original generate_response chain, evaluated in full for a fair comparison"""
+    message_lower = message.lower().strip()
+    intents = []
+    if any(message_lower.startswith(greeting) for greeting in GREETINGS):
+        intents.append('greeting')
+    if any(thank in message_lower for thank in THANKS):
+        intents.append('thanks')
+    if any(goodbye in message_lower for goodbye in GOODBYES):
+        intents.append('goodbye')
+    if message_lower == "help":
+        intents.append('help')
+    if any(word in message_lower for word in DONE):
+        intents.append('done')
+    for specialist in SPECIALISTS:
+        if specialist in message_lower:
+            intents.append('specialist')
+            break
+    if any(term in message_lower for term in ["doctor", "physician"]):
+        intents.append('doctor')
+    if any(term in message.lower() for term in ["schedule", "appointment", "book"]) and "them" in message.lower():
+        intents.append('schedule')
+    return intents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000, help="Passes over the sample messages")
+    args = parser.parse_args()
+
+    router = IntentRouter()
+    for message in MESSAGES:
+        print(f"{message[:48]:<50} legacy={legacy_classify(message)} router={router.route(message).intents}")
+    print()
+
+    for name, classify in [('legacy chain', legacy_classify), ('compiled router', router.route)]:
+        seconds = min(timeit.repeat(lambda: [classify(m) for m in MESSAGES], number=args.number // 10, repeat=5))
+        per_message = seconds / (args.number // 10 * len(MESSAGES)) * 1e6
+        print(f"{name:<16} {per_message:8.2f} us/message")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Local stand-ins for the Gemini and Places APIs, with configurable latency and errors
+
+Usage: python bench/fake_upstreams.py [--gemini-port 8766] [--places-port 8765]
+           [--gemini-latency 0.8] [--places-latency 0.2] [--sigma 0.3] [--error-rate 0.0]
+
+Latency is drawn from a lognormal distribution with the given median (seconds)
+and sigma; a fraction of requests (error-rate) fail with HTTP 503. Point the
+backend at them with:
+    "gemini": {"api_key": "fake", "transport": "rest", "api_endpoint": "http://127.0.0.1:8766"}
+    "google_places": {"api_key": "fake", "url": "http://127.0.0.1:8765/"}
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Phrases that make the fake model answer like a symptom extraction
+SYMPTOM_CUES = ('have', 'feel', 'feeling', 'pain', 'ache', 'also', 'suffer', 'been')
+
+
+class Behavior:
+    """Latency and error distribution for one fake upstream"""
+
+    def __init__(self, median=0.2, sigma=0.3, error_rate=0.0, seed=None):
+        self.median = median
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def sample(self):
+        """Return (delay_seconds, fail) for one request"""
+        with self._lock:
+            self.requests += 1
+            delay = self.median * math.exp(self._random.gauss(0, self.sigma)) if self.median > 0 else 0.0
+            fail = self._random.random() < self.error_rate
+            self.errors += fail
+        return delay, fail
+
+
+def model_reply(message):
+    """Deterministic stand-in for the model: symptom extraction or a short answer"""
+    text = message.strip().rstrip('.!?')
+    if any(cue in text.lower().split() for cue in SYMPTOM_CUES):
+        phrases = re.split(r",|\band\b|\bwith\b", re.sub(r"(?i)^.*?\b(have|feel|feeling|also|been)\b", '', text))
+        symptoms = [phrase.strip() for phrase in phrases if phrase.strip()]
+        return f"Symptoms: {', '.join(symptoms)}\nSeverity: 5\nMessage: I'm sorry to hear that."
+    return "Message: That's a good question. A doctor can give you advice specific to your situation."
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    behavior = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json'):
+        payload = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _delay(self):
+        delay, fail = self.behavior.sample()
+        time.sleep(delay)
+        if fail:
+            self._send(503, json.dumps({'error': {'code': 503, 'message': 'Injected failure', 'status': 'UNAVAILABLE'}}))
+        return not fail
+
+
+class GeminiHandler(_Handler):
+    """Serves generateContent and streamGenerateContent on the v1beta REST surface"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not self._delay():
+            return
+        prompt = ''.join(part.get('text', '') for content in body.get('contents', [])
+                         for part in content.get('parts', []))
+        text = model_reply(prompt.split('Message:')[-1])
+        path = urlparse(self.path).path
+        if path.endswith(':streamGenerateContent'):
+            chunks = [text[i:i + 24] for i in range(0, len(text), 24)]
+            self._send(200, json.dumps([self._response(chunk) for chunk in chunks]))
+        elif path.endswith(':generateContent'):
+            self._send(200, json.dumps(self._response(text)))
+        else:
+            self._send(404, json.dumps({'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}}))
+
+    @staticmethod
+    def _response(text):
+        return {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'},
+                                'finishReason': 'STOP', 'index': 0}]}
+
+
+class PlacesHandler(_Handler):
+    """Serves text search results scattered around the requested location"""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        if not self._delay():
+            return
+        name = query.get('query', ['doctor'])[0]
+        lat, lng = map(float, query.get('location', ['39.6837,-75.7497'])[0].split(','))
+        results = [{
+            'name': f"{name.title()} #{i}, MD",
+            'formatted_address': f"{100 + i} Main St, Newark, DE",
+            'place_id': f"{name}-{lat:.3f}-{lng:.3f}-{i}",
+            'geometry': {'location': {'lat': lat + 0.004 * i, 'lng': lng - 0.004 * i}},
+        } for i in range(5)]
+        self._send(200, json.dumps({'status': 'OK', 'results': results}))
+
+
+def start_server(handler, port, behavior):
+    """Start a fake upstream on a daemon thread; returns the server (port 0 picks a free port)"""
+    handler_class = type(handler.__name__, (handler,), {'behavior': behavior})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f'fake-{handler.__name__}', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--gemini-port', type=int, default=8766)
+    parser.add_argument('--places-port', type=int, default=8765)
+    parser.add_argument('--gemini-latency', type=float, default=0.8)
+    parser.add_argument('--places-latency', type=float, default=0.2)
+    parser.add_argument('--sigma', type=float, default=0.3)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    start_server(GeminiHandler, args.gemini_port, Behavior(args.gemini_latency, args.sigma, args.error_rate))
+    start_server(PlacesHandler, args.places_port, Behavior(args.places_latency, args.sigma, args.error_rate))
+    print(f"Fake Gemini on http://127.0.0.1:{args.gemini_port}, fake Places on http://127.0.0.1:{args.places_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
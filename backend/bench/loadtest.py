@@ -0,0 +1,303 @@
+"""Load test: simulated multi-turn conversations against a local backend with fake upstreams
+
+Usage: python bench/loadtest.py [--users 20] [--duration 30] [--workers 2] [--threads 8]
+           [--gemini-latency 0.8] [--places-latency 0.2] [--error-rate 0.0]
+           [--save-baseline] [--fail-on-regression]
+
+Boots serve.py (or the Flask server with --server flask) against the fake Gemini
+and Places servers from fake_upstreams.py, then has --users concurrent users run
+conversations built from the dataset CSV:
+    greeting -> [question] -> symptoms -> more symptoms -> "that's all" -> schedule with them
+The optional free-form question (--question-rate) is what exercises the model;
+symptom turns are mostly handled by the local extractor.
+Reports throughput and p50/p95/p99 latency per turn type, with the mean stage
+breakdown from Server-Timing. Results are written to bench/results/ and compared
+with the saved baseline, if there is one.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+DATASET = os.path.join(os.path.dirname(BACKEND_DIR), 'dataset', 'dataset_with_specialists.csv')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+sys.path.insert(0, BENCH_DIR)
+
+from fake_upstreams import Behavior, GeminiHandler, PlacesHandler, start_server  # noqa: E402
+
+INTENTS = ['greeting', 'question', 'symptoms', 'more_symptoms', 'done', 'schedule']
+GREETINGS = ["hi", "hello", "hey", "good morning"]
+DONE = ["no, that's all", "nope", "that's all", "no"]
+SYMPTOM_TEMPLATES = ["I have {} and {}", "I've been having {} and {}", "I feel {} with {}"]
+MORE_TEMPLATES = ["I also have {}", "also {}", "I have {} too"]
+QUESTION_TEMPLATES = ["what causes {}?", "is {} something to worry about?", "how long does {} usually last?"]
+NEWARK = (39.6837, -75.7497)
+
+
+def load_symptom_sets(path=DATASET):
+    """Distinct symptom lists (3 or more symptoms) from the dataset, in readable form"""
+    sets = set()
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            symptoms = [' '.join(value.replace('_', ' ').split())
+                        for key, value in row.items() if key.startswith('Symptom') and value and value.strip()]
+            if len(symptoms) >= 3:
+                sets.add(tuple(symptoms))
+    return sorted(sets)
+
+
+def make_conversation(rng, symptom_sets, question_rate=0.0):
+    """Return [(intent, message)] for one scripted conversation"""
+    symptoms = rng.sample(rng.choice(symptom_sets), 3)
+    hour, minute = rng.randint(1, 11), rng.choice(['00', '15', '30', '45'])
+    date = f"{rng.randint(1, 12)}/{rng.randint(1, 28)}/{datetime.now().year % 100 + 1}"
+    turns = [('greeting', rng.choice(GREETINGS))]
+    if rng.random() < question_rate:
+        turns.append(('question', rng.choice(QUESTION_TEMPLATES).format(rng.choice(symptoms))))
+    return turns + [
+        ('symptoms', rng.choice(SYMPTOM_TEMPLATES).format(symptoms[0], symptoms[1])),
+        ('more_symptoms', rng.choice(MORE_TEMPLATES).format(symptoms[2])),
+        ('done', rng.choice(DONE)),
+        ('schedule', f"schedule an appointment with them for {hour}:{minute} PM on {date}"),
+    ]
+
+
+def parse_server_timing(header):
+    stages = {}
+    for part in (header or '').split(','):
+        name, _, duration = part.strip().partition(';dur=')
+        if duration:
+            stages[name] = float(duration)
+    return stages
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.stages = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+    def record(self, intent, seconds, ok, server_timing=None):
+        with self._lock:
+            self.latencies[intent].append(seconds)
+            if not ok:
+                self.errors[intent] += 1
+            for stage, ms in parse_server_timing(server_timing).items():
+                self.stages[intent][stage] += ms
+
+    def summary(self):
+        intents = {}
+        for intent in INTENTS:
+            values = np.array(self.latencies.get(intent, [])) * 1000
+            if not values.size:
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            intents[intent] = {
+                'count': int(values.size),
+                'errors': self.errors.get(intent, 0),
+                'mean_ms': float(values.mean()),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'stages_ms': {stage: total / values.size for stage, total in self.stages[intent].items()},
+            }
+        return intents
+
+
+def run_user(base_url, user, args, symptom_sets, recorder, stop_at):
+    rng = random.Random(args.seed * 1000 + user)
+    session = requests.Session()
+    conversation = 0
+    while time.time() < stop_at:
+        conversation += 1
+        user_id = f"bench-{user}-{conversation}"
+        location = None
+        if args.location_rate and rng.random() < args.location_rate:
+            location = {'lat': NEWARK[0] + rng.uniform(-0.1, 0.1), 'lng': NEWARK[1] + rng.uniform(-0.1, 0.1)}
+        for intent, message in make_conversation(rng, symptom_sets, args.question_rate):
+            if time.time() >= stop_at:
+                return
+            body = {'message': message, 'user_id': user_id, **(location or {})}
+            start = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/api/chat", json=body, timeout=60)
+                recorder.record(intent, time.perf_counter() - start, response.status_code == 200,
+                                response.headers.get('Server-Timing'))
+            except requests.RequestException:
+                recorder.record(intent, time.perf_counter() - start, False)
+            if args.think:
+                time.sleep(rng.expovariate(1 / args.think))
+
+
+def write_config(workdir, args, gemini_port, places_port):
+    config = {
+        'gemini': {'api_key': 'fake', 'transport': 'rest', 'api_endpoint': f'http://127.0.0.1:{gemini_port}'},
+        'google_places': {'api_key': 'fake', 'url': f'http://127.0.0.1:{places_port}/',
+                          'cache_path': os.path.join(workdir, 'places_cache.json')},
+        'sessions': {'backend': 'sqlite', 'path': os.path.join(workdir, 'sessions.db')},
+        'calendar': {'path': os.path.join(workdir, 'calendar.db')},
+    }
+    for section, values in json.loads(args.config_overrides).items():
+        config.setdefault(section, {}).update(values)
+    path = os.path.join(workdir, 'config.json')
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=2)
+    return path
+
+
+def start_backend(args, config_path):
+    env = {**os.environ, 'LOCALCLERIC_CONFIG': config_path}
+    if args.server == 'flask':
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(args.port), '--with-threads']
+    else:
+        command = [sys.executable, 'serve.py', '--bind', f'127.0.0.1:{args.port}',
+                   '--workers', str(args.workers), '--threads', str(args.threads)]
+    log = open(os.path.join(os.path.dirname(config_path), 'server.log'), 'w')
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"Backend exited during startup; see {log.name}")
+        try:
+            if requests.get(f"http://127.0.0.1:{args.port}/readyz", timeout=1).status_code == 200:
+                return server
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    server.terminate()
+    sys.exit("Backend did not become ready within 60s")
+
+
+def compare(results, baseline, tolerance):
+    """Print per-intent latency changes against a baseline; return the regressed (intent, metric) pairs"""
+    regressions = []
+    print(f"\nCompared with baseline from {baseline.get('timestamp', '?')}:")
+    for intent, current in results['intents'].items():
+        previous = baseline.get('intents', {}).get(intent)
+        if not previous:
+            continue
+        changes = []
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            before, after = previous[metric], current[metric]
+            change = (after - before) / before if before else 0.0
+            # Ignore sub-millisecond noise on turns that never leave the process
+            if change > tolerance and after - before > 1.0:
+                regressions.append((intent, metric))
+                changes.append(f"{metric[:-3]} {before:.1f} -> {after:.1f} ms (+{change:.0%}) REGRESSION")
+            else:
+                changes.append(f"{metric[:-3]} {change:+.0%}")
+        print(f"  {intent:<14}" + ', '.join(changes))
+    before, after = baseline.get('throughput_rps', 0), results['throughput_rps']
+    print(f"  throughput     {before:.1f} -> {after:.1f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20, help="concurrent simulated users")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds to run")
+    parser.add_argument('--think', type=float, default=0.0, help="mean think time between turns, seconds")
+    parser.add_argument('--question-rate', type=float, default=0.3, help="fraction of conversations asking a question")
+    parser.add_argument('--location-rate', type=float, default=0.5, help="fraction of conversations sending lat/lng")
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--port', type=int, default=5095)
+    parser.add_argument('--gemini-latency', type=float, default=0.8, help="median fake Gemini latency, seconds")
+    parser.add_argument('--places-latency', type=float, default=0.2, help="median fake Places latency, seconds")
+    parser.add_argument('--sigma', type=float, default=0.3, help="lognormal sigma of upstream latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of upstream requests failing")
+    parser.add_argument('--config-overrides', default='{}', help="JSON merged into the generated config sections")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default=os.path.join(RESULTS_DIR, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed relative latency increase")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    symptom_sets = load_symptom_sets()
+    gemini = start_server(GeminiHandler, 0, Behavior(args.gemini_latency, args.sigma, args.error_rate, args.seed))
+    places = start_server(PlacesHandler, 0, Behavior(args.places_latency, args.sigma, args.error_rate, args.seed))
+    workdir = tempfile.mkdtemp(prefix='localcleric-bench-')
+    config_path = write_config(workdir, args, gemini.server_address[1], places.server_address[1])
+    server = start_backend(args, config_path)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    recorder = Recorder()
+    try:
+        start = time.time()
+        stop_at = start + args.duration
+        users = [threading.Thread(target=run_user, args=(base_url, user, args, symptom_sets, recorder, stop_at))
+                 for user in range(args.users)]
+        for thread in users:
+            thread.start()
+        for thread in users:
+            thread.join()
+        elapsed = time.time() - start
+        server_stats = requests.get(f"{base_url}/api/stats", timeout=5).json()
+    finally:
+        server.terminate()
+        server.wait()
+
+    intents = recorder.summary()
+    total = sum(summary['count'] for summary in intents.values())
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'settings': {key: value for key, value in vars(args).items()
+                     if key not in ('baseline', 'save_baseline', 'fail_on_regression')},
+        'duration_s': elapsed,
+        'requests': total,
+        'errors': sum(summary['errors'] for summary in intents.values()),
+        'throughput_rps': total / elapsed,
+        'upstream_requests': {'gemini': gemini.RequestHandlerClass.behavior.requests,
+                              'places': places.RequestHandlerClass.behavior.requests},
+        'intents': intents,
+        'server_stats': server_stats,
+    }
+
+    print(f"{total} requests in {elapsed:.1f}s: {results['throughput_rps']:.1f} req/s, {results['errors']} errors")
+    print(f"Upstream requests: {results['upstream_requests']['gemini']} Gemini, {results['upstream_requests']['places']} Places")
+    print(f"{'intent':<14}{'count':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  stages (mean ms)")
+    for intent, summary in intents.items():
+        stages = ', '.join(f"{stage} {ms:.1f}" for stage, ms in summary['stages_ms'].items() if stage != 'total')
+        print(f"{intent:<14}{summary['count']:>7}{summary['errors']:>8}{summary['p50_ms']:>9.1f}"
+              f"{summary['p95_ms']:>9.1f}{summary['p99_ms']:>9.1f}  {stages}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {path}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    if args.save_baseline:
+        shutil.copyfile(path, args.baseline)
+        print(f"Saved as baseline: {args.baseline}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
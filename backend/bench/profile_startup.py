@@ -0,0 +1,96 @@
+"""Startup profiler: per-module import cost and time-to-first-request
+
+Usage: python bench/profile_startup.py [--top N] [--port PORT] [--timeout SECONDS]
+
+Imports the app under `python -X importtime` and reports the most expensive
+top-level packages (own import time of their modules), then starts `serve.py` with one worker and measures how long
+it takes until /healthz and a router-only /api/chat request succeed. Set
+LOCALCLERIC_CONFIG to point at a config file with (possibly fake) API keys.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_costs():
+    """Return {top-level package: (self_us, modules)} for importing app.py
+
+    The import runs as the pre-fork master does, so no warm-up thread imports
+    modules concurrently and skews the timings.
+    """
+    env = {**os.environ, 'LOCALCLERIC_PREFORK': '1'}
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"Importing app failed:\n{result.stderr[-2000:]}")
+
+    costs = defaultdict(lambda: [0, 0])
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        costs[package][0] += int(self_us)
+        costs[package][1] += 1
+    return costs
+
+
+def wait_for(url, data=None, timeout=30.0):
+    """Poll a URL until it answers 200; return the elapsed seconds"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                if response.status == 200:
+                    return time.perf_counter() - start
+        except OSError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} did not answer within {timeout}s")
+
+
+def time_to_first_request(port, timeout):
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, 'serve.py', '--workers', '1', '--bind', f'127.0.0.1:{port}'],
+                              cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        health = wait_for(f'http://127.0.0.1:{port}/healthz', timeout=timeout)
+        body = json.dumps({'message': 'hello', 'user_id': 'startup-profile'}).encode()
+        chat_start = time.perf_counter()
+        wait_for(f'http://127.0.0.1:{port}/api/chat', data=body, timeout=timeout)
+        chat = time.perf_counter() - chat_start
+        return health, time.perf_counter() - start, chat
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--port', type=int, default=5093)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    costs = import_costs()
+    total = sum(self_us for self_us, _ in costs.values())
+    print(f"Import of app.py: {total / 1000:.1f} ms in {sum(n for _, n in costs.values())} modules")
+    print(f"{'package':<24}{'ms':>10}{'modules':>10}")
+    for package, (self_us, modules) in sorted(costs.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"{package:<24}{self_us / 1000:>10.1f}{modules:>10}")
+
+    health, first_request, chat = time_to_first_request(args.port, args.timeout)
+    print(f"\nServer start to /healthz: {health * 1000:.0f} ms")
+    print(f"Server start to first /api/chat response: {first_request * 1000:.0f} ms (request itself {chat * 1000:.0f} ms)")
+
+
+if __name__ == '__main__':
+    main()
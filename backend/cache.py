@@ -0,0 +1,151 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; saves from several processes are then not serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry, optionally persisted to a JSON file
+
+    Writes to the file are deferred by save_delay seconds and made off the
+    request thread, so a burst of new entries costs one save. Each save merges
+    with what other processes have written to the file, under a file lock, so
+    workers sharing a path add to it rather than overwrite each other.
+    """
+
+    def __init__(self, max_entries=512, ttl=24 * 3600, path=None, save_delay=2.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.save_delay = save_delay
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._timer = None
+        self._timer_pid = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saves = 0
+        if path:
+            self.load()
+            atexit.register(self.flush)
+
+    def get(self, key, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += count
+                return None
+            self._entries.move_to_end(key)
+            self.hits += count
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.time() + (ttl or self.ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if not self.path:
+                return
+            self._dirty = True
+            if self._timer is not None and self._timer_pid == os.getpid():
+                return
+            timer = self._timer = threading.Timer(self.save_delay, self.flush)
+            timer.daemon = True
+            self._timer_pid = os.getpid()
+        timer.start()
+
+    def flush(self):
+        """Save now if there are unsaved entries, cancelling any pending deferred save"""
+        with self._lock:
+            timer = self._timer if self._timer_pid == os.getpid() else None
+            self._timer = None
+            dirty, self._dirty = self._dirty, False
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+            timer.join()
+        if dirty:
+            self.save()
+
+    def items(self):
+        """Return a snapshot of the live (key, value) pairs"""
+        now = time.time()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._entries.items() if expires_at >= now]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache file {self.path}: {str(e)}")
+            return
+        now = time.time()
+        with self._lock:
+            for key, (expires_at, value) in stored.items():
+                if expires_at >= now:
+                    self._entries[key] = (expires_at, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logger.info(f"Loaded {len(self._entries)} cached entries from {self.path}")
+
+    def save(self):
+        """Merge with the file and write it atomically, so readers never see a partial file"""
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    with open(self.path) as f:
+                        merged = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    merged = {}
+                now = time.time()
+                with self._lock:
+                    for key, (expires_at, value) in self._entries.items():
+                        stored = merged.get(key)
+                        if stored is None or stored[0] < expires_at:
+                            merged[key] = (expires_at, value)
+                live = sorted(((key, entry) for key, entry in merged.items() if entry[0] >= now),
+                              key=lambda item: item[1][0])
+                tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(dict(live[-self.max_entries:]), f)
+                os.replace(tmp_path, self.path)
+            with self._lock:
+                self.saves += 1
+        except Exception as e:
+            logger.error(f"Error saving cache to {self.path}: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'saves': self.saves,
+            }
@@ -0,0 +1,453 @@
+import bisect
+import itertools
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from werkzeug.exceptions import BadRequest, Conflict
+
+logger = logging.getLogger(__name__)
+
+# How far ahead free-slot searches look before giving up
+SEARCH_HORIZON_DAYS = 90
+
+
+def format_time(dt):
+    """12-hour clock label, as used in event_details ("2:00 PM")"""
+    return f"{dt.hour % 12 or 12}:{dt.minute:02d} {'AM' if dt.hour < 12 else 'PM'}"
+
+
+class Event:
+    """One calendar entry; start and end are epoch seconds, end exclusive"""
+
+    __slots__ = ('id', 'title', 'start', 'end', 'ai_scheduled', 'created_at')
+
+    def __init__(self, title, start, end, id=None, ai_scheduled=False, created_at=None):
+        self.id = id or uuid.uuid4().hex
+        self.title = title
+        self.start = start
+        self.end = end
+        self.ai_scheduled = ai_scheduled
+        self.created_at = created_at or time.time()
+
+    def to_dict(self):
+        start = datetime.fromtimestamp(self.start)
+        return {
+            'id': self.id,
+            'title': self.title,
+            'date': start.strftime('%Y-%m-%d'),
+            'time': format_time(start),
+            'start': start.isoformat(),
+            'end': datetime.fromtimestamp(self.end).isoformat(),
+            'ai_scheduled': self.ai_scheduled,
+        }
+
+
+class IntervalIndex:
+    """A user's events sorted by start, with a running maximum of end times
+
+    Because max_ends is non-decreasing, "does anything overlap [start, end)"
+    is one bisect: only events starting before end can overlap, and one of
+    them does exactly when the largest end among them is after start.
+    """
+
+    def __init__(self, events=()):
+        self.events = sorted(events, key=lambda event: (event.start, event.end))
+        self.starts = [event.start for event in self.events]
+        self.max_ends = list(itertools.accumulate((event.end for event in self.events), max))
+
+    def __len__(self):
+        return len(self.events)
+
+    def insert(self, event):
+        i = bisect.bisect_right(self.starts, event.start)
+        self.events.insert(i, event)
+        self.starts.insert(i, event.start)
+        self.max_ends.insert(i, max(self.max_ends[i - 1], event.end) if i else event.end)
+        # Later running maxima only change until one already reaches this end
+        for j in range(i + 1, len(self.max_ends)):
+            if self.max_ends[j] >= event.end:
+                break
+            self.max_ends[j] = event.end
+
+    def remove(self, event):
+        i = bisect.bisect_left(self.starts, event.start)
+        while i < len(self.events) and self.events[i].id != event.id:
+            i += 1
+        if i == len(self.events):
+            return False
+        del self.events[i], self.starts[i], self.max_ends[i:]
+        previous = self.max_ends[-1] if self.max_ends else -math.inf
+        for later in self.events[i:]:
+            previous = max(previous, later.end)
+            self.max_ends.append(previous)
+        return True
+
+    def blocked_until(self, start, end):
+        """None if [start, end) is free, else the latest end among events overlapping it"""
+        i = bisect.bisect_left(self.starts, end)
+        if i == 0 or self.max_ends[i - 1] <= start:
+            return None
+        return self.max_ends[i - 1]
+
+    def overlapping(self, start, end):
+        """Events overlapping [start, end)"""
+        found = []
+        j = bisect.bisect_left(self.starts, end) - 1
+        while j >= 0 and self.max_ends[j] > start:
+            if self.events[j].end > start:
+                found.append(self.events[j])
+            j -= 1
+        found.reverse()
+        return found
+
+    def between(self, start=None, end=None):
+        """Events starting in [start, end)"""
+        lo = 0 if start is None else bisect.bisect_left(self.starts, start)
+        hi = len(self.starts) if end is None else bisect.bisect_left(self.starts, end)
+        return self.events[lo:hi]
+
+
+class CalendarStore:
+    """Base class: per-user event collections, like Firestore's users/{uid}/events
+
+    version() changes on every write to a user's events, from any process, so
+    cached indexes can tell when they are stale.
+    """
+
+    def load(self, user_id):
+        raise NotImplementedError
+
+    def add(self, user_id, events):
+        """Store events and return the user's new version"""
+        raise NotImplementedError
+
+    def delete(self, user_id, event_id):
+        """Delete an event; returns (deleted event or None, new version)"""
+        raise NotImplementedError
+
+    def version(self, user_id):
+        raise NotImplementedError
+
+
+class InMemoryCalendarStore(CalendarStore):
+    """Process-local store, for development and single-worker deployments"""
+
+    def __init__(self):
+        self._events = {}  # user_id -> {event_id: Event}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id):
+        with self._lock:
+            return list(self._events.get(user_id, {}).values())
+
+    def add(self, user_id, events):
+        with self._lock:
+            user_events = self._events.setdefault(user_id, {})
+            for event in events:
+                user_events[event.id] = event
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            return self._versions[user_id]
+
+    def delete(self, user_id, event_id):
+        with self._lock:
+            event = self._events.get(user_id, {}).pop(event_id, None)
+            if event is not None:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            return event, self._versions.get(user_id, 0)
+
+    def version(self, user_id):
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+
+class SQLiteCalendarStore(CalendarStore):
+    """SQLite (WAL mode) stand-in for Firestore, shared by worker processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("""CREATE TABLE IF NOT EXISTS events (
+            user_id TEXT NOT NULL,
+            id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            start REAL NOT NULL,
+            end REAL NOT NULL,
+            ai_scheduled INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (user_id, id)
+        )""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS event_versions (
+            user_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )""")
+        conn.commit()
+
+    def _connection(self):
+        """One connection per thread and process; connections are not shared across fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _bump(self, conn, user_id):
+        conn.execute("""INSERT INTO event_versions (user_id, version) VALUES (?, 1)
+                        ON CONFLICT(user_id) DO UPDATE SET version = version + 1""", (user_id,))
+        return conn.execute("SELECT version FROM event_versions WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def load(self, user_id):
+        rows = self._connection().execute(
+            "SELECT id, title, start, end, ai_scheduled, created_at FROM events WHERE user_id = ?", (user_id,))
+        return [Event(title, start, end, id=event_id, ai_scheduled=bool(ai_scheduled), created_at=created_at)
+                for event_id, title, start, end, ai_scheduled, created_at in rows]
+
+    def add(self, user_id, events):
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO events (user_id, id, title, start, end, ai_scheduled, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(user_id, event.id, event.title, event.start, event.end, int(event.ai_scheduled), event.created_at)
+                 for event in events])
+            return self._bump(conn, user_id)
+
+    def delete(self, user_id, event_id):
+        conn = self._connection()
+        with conn:
+            row = conn.execute("SELECT title, start, end, ai_scheduled, created_at FROM events "
+                               "WHERE user_id = ? AND id = ?", (user_id, event_id)).fetchone()
+            if row is None:
+                return None, self.version(user_id)
+            conn.execute("DELETE FROM events WHERE user_id = ? AND id = ?", (user_id, event_id))
+            title, start, end, ai_scheduled, created_at = row
+            event = Event(title, start, end, id=event_id, ai_scheduled=bool(ai_scheduled), created_at=created_at)
+            return event, self._bump(conn, user_id)
+
+    def version(self, user_id):
+        row = self._connection().execute(
+            "SELECT version FROM event_versions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+
+class SlotConflict(Conflict):
+    """Raised when a new event overlaps existing ones; carries the next free slots"""
+
+    def __init__(self, conflicts, suggestions):
+        super().__init__(f"Time slot overlaps {len(conflicts)} existing event(s)")
+        self.conflicts = conflicts
+        self.suggestions = suggestions  # Start times (epoch seconds) of free slots after the request
+
+
+class CalendarService:
+    """Per-user calendars with cached interval indexes for conflict and free-slot queries
+
+    A user's index is built from the store on first use (one sort, so bulk
+    loads of thousands of events stay cheap) and updated in place on this
+    process's writes. The store's per-user version tells us when another
+    process has written, in which case the index is rebuilt.
+    """
+
+    LOCK_STRIPES = 64
+
+    def __init__(self, store=None, max_users=1000, slot_minutes=30, appointment_minutes=30,
+                 open_hour=9, close_hour=17, workdays=(0, 1, 2, 3, 4)):
+        self.store = store or InMemoryCalendarStore()
+        self.max_users = max_users
+        self.slot = slot_minutes * 60
+        self.appointment = appointment_minutes * 60
+        self.open_hour = open_hour
+        self.close_hour = close_hour
+        self.workdays = set(workdays)
+        self._indexes = OrderedDict()  # user_id -> (version, IntervalIndex)
+        self._lock = threading.Lock()
+        self._user_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.index_builds = 0
+        self.incremental_updates = 0
+        self.conflicts = 0
+
+    def _user_lock(self, user_id):
+        return self._user_locks[hash(user_id) % self.LOCK_STRIPES]
+
+    def _index(self, user_id):
+        """The user's index, rebuilt if the store has changed since it was built"""
+        version = self.store.version(user_id)
+        with self._lock:
+            cached = self._indexes.get(user_id)
+            if cached is not None and cached[0] == version:
+                self._indexes.move_to_end(user_id)
+                return cached[1]
+        index = IntervalIndex(self.store.load(user_id))
+        self._remember(user_id, version, index)
+        with self._lock:
+            self.index_builds += 1
+        return index
+
+    def _remember(self, user_id, version, index):
+        with self._lock:
+            self._indexes[user_id] = (version, index)
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+
+    def _apply(self, user_id, index, new_version, update):
+        """Apply a write to the cached index if it was the only change since the index was built"""
+        with self._lock:
+            cached = self._indexes.get(user_id)
+            current = cached is not None and cached[1] is index and cached[0] == new_version - 1
+        if current:
+            update(index)
+            self._remember(user_id, new_version, index)
+            with self._lock:
+                self.incremental_updates += 1
+        else:
+            with self._lock:
+                self._indexes.pop(user_id, None)
+
+    def events(self, user_id, start=None, end=None):
+        """Events starting in [start, end), in start order"""
+        with self._user_lock(user_id):
+            return list(self._index(user_id).between(start, end))
+
+    def conflicts_for(self, user_id, start, end):
+        with self._user_lock(user_id):
+            return self._index(user_id).overlapping(start, end)
+
+    def add_event(self, user_id, title, start, end=None, ai_scheduled=False):
+        """Insert an event, raising SlotConflict with suggested free slots if it overlaps another"""
+        if start < time.time():
+            raise BadRequest("Event start is in the past")
+        end = end or start + self.appointment
+        with self._user_lock(user_id):
+            index = self._index(user_id)
+            if index.blocked_until(start, end) is not None:
+                with self._lock:
+                    self.conflicts += 1
+                raise SlotConflict(index.overlapping(start, end), self._free_slots(index, start, end - start, 3))
+            event = Event(title, start, end, ai_scheduled=ai_scheduled)
+            version = self.store.add(user_id, [event])
+            self._apply(user_id, index, version, lambda index: index.insert(event))
+            return event
+
+    def delete_event(self, user_id, event_id):
+        with self._user_lock(user_id):
+            index = self._index(user_id)
+            event, version = self.store.delete(user_id, event_id)
+            if event is not None:
+                self._apply(user_id, index, version, lambda index: index.remove(event))
+            return event
+
+    def bulk_load(self, user_id, events):
+        """Store many events at once without conflict checks, rebuilding the index in one pass"""
+        with self._user_lock(user_id):
+            index = self._index(user_id)
+            version = self.store.add(user_id, events)
+            with self._lock:
+                cached = self._indexes.get(user_id)
+                current = cached is not None and cached[1] is index and cached[0] == version - 1
+            if current:
+                self._remember(user_id, version, IntervalIndex(index.events + list(events)))
+            else:
+                self._index(user_id)
+            return len(events)
+
+    def free_slots(self, user_id, after, count=3, duration=None):
+        """Start times of the next count free slots of duration seconds, within opening hours"""
+        with self._user_lock(user_id):
+            return self._free_slots(self._index(user_id), after, duration or self.appointment, count)
+
+    def _free_slots(self, index, after, duration, count):
+        slots = []
+        horizon = after + SEARCH_HORIZON_DAYS * 24 * 3600
+        start = self._opening(self._align(after), duration)
+        while len(slots) < count and start < horizon:
+            blocked = index.blocked_until(start, start + duration)
+            if blocked is None:
+                slots.append(start)
+                blocked = start + duration
+            start = self._opening(self._align(blocked), duration)
+        return slots
+
+    def _align(self, timestamp):
+        """Round up to the slot grid, counted from local midnight"""
+        day = datetime.fromtimestamp(timestamp).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        return day + math.ceil((timestamp - day) / self.slot) * self.slot
+
+    def _opening(self, timestamp, duration):
+        """The first start at or after timestamp that fits within opening hours on a workday"""
+        dt = datetime.fromtimestamp(timestamp)
+        while True:
+            opens = dt.replace(hour=self.open_hour, minute=0, second=0, microsecond=0)
+            closes = dt.replace(hour=self.close_hour, minute=0, second=0, microsecond=0)
+            if dt < opens:
+                dt = opens
+            if dt.weekday() in self.workdays and dt + timedelta(seconds=duration) <= closes:
+                return dt.timestamp()
+            dt = opens + timedelta(days=1)
+
+    def parse_event(self, data):
+        """Validate an event body: title plus date and time, or an ISO start; returns an Event"""
+        if not isinstance(data, dict) or not data.get('title'):
+            raise BadRequest("Event title is required")
+        if data.get('start'):
+            start = self.parse_datetime(data['start'], 'start')
+        elif data.get('date'):
+            start = self.parse_datetime(f"{data['date']} {data.get('time') or '9:00 AM'}", 'date/time')
+        else:
+            raise BadRequest("Event date or start is required")
+        try:
+            duration = float(data.get('duration', self.appointment / 60)) * 60
+        except (TypeError, ValueError):
+            raise BadRequest("duration must be a number of minutes")
+        if duration <= 0:
+            raise BadRequest("duration must be positive")
+        return Event(data['title'], start, start + duration, ai_scheduled=bool(data.get('ai_scheduled')))
+
+    @staticmethod
+    def parse_datetime(value, field):
+        """Epoch seconds from an ISO date/datetime or a 'YYYY-MM-DD h:MM AM' string"""
+        text = str(value).strip()
+        try:
+            return datetime.fromisoformat(text).timestamp()
+        except ValueError:
+            pass
+        for layout in ('%Y-%m-%d %I:%M %p', '%Y-%m-%d %H:%M'):
+            try:
+                return datetime.strptime(text, layout).timestamp()
+            except ValueError:
+                continue
+        raise BadRequest(f"Invalid {field}: {value}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users_indexed': len(self._indexes),
+                'events_indexed': sum(len(index) for _, index in self._indexes.values()),
+                'index_builds': self.index_builds,
+                'incremental_updates': self.incremental_updates,
+                'conflicts': self.conflicts,
+            }
+
+
+def create_calendar_service(config, default_path):
+    """Build the calendar service described by the optional 'calendar' config section"""
+    options = dict(config or {})
+    backend = options.pop('backend', 'sqlite')
+    path = options.pop('path', default_path)
+    if backend == 'sqlite':
+        return CalendarService(SQLiteCalendarStore(path), **options)
+    if backend == 'memory':
+        return CalendarService(InMemoryCalendarStore(), **options)
+    raise ValueError(f"Unknown calendar backend: {backend}")
@@ -1,39 +1,194 @@
-import google.generativeai as genai
+import hashlib
 import json
 import logging
-import requests
-from werkzeug.exceptions import BadRequest, InternalServerError
+import os
+import threading
+import time
+from werkzeug.exceptions import BadRequest, InternalServerError, TooManyRequests
 from datetime import datetime
 import re
+from symptom_index import SymptomIndex
+from diagnosis import DiagnosisEngine
+from symptom_extractor import SymptomExtractor
+from intent_router import IntentRouter
+from places_client import PlacesClient
+from session_store import InMemorySessionStore
+from llm_cache import LLMCache, normalize_message
+from resilience import CallPolicy
+from prefetch import Prefetcher
+from batch import BatchRunner
+from admission import AdmissionController
+from calendar_service import CalendarService, format_time
+from conversation import ConversationContext
+import metrics
 
 logger = logging.getLogger(__name__)
 
-PLACES_API_URL = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+SEARCH_RADIUS_M = 10000  # 10km radius
+
+SYSTEM_PROMPT = """You are a medical assistant. Keep responses under 2 sentences. Only include SCHEDULE_EVENT if the user explicitly asks to schedule an appointment with a specific doctor. For scheduling use:
+SCHEDULE_EVENT:
+Title: [title]
+Date: YYYY-MM-DD
+Time: HH:MM
+
+"""
+BASE_PROMPT = SYSTEM_PROMPT + "Message: "
+# Cached responses are keyed on this, so editing the template invalidates them
+PROMPT_VERSION = hashlib.sha1(BASE_PROMPT.encode()).hexdigest()[:12]
+
+GENERAL_PHYSICIAN_FALLBACK = "I recommend seeing a general physician to evaluate your symptoms. Would you like me to find one nearby?"
+
+# Turns that carry nothing the model needs as context
+UNRECORDED_INTENTS = ('greeting', 'thanks', 'goodbye', 'help')
+
+class DisplayFilter:
+    """Incrementally extracts the user-visible reply from streamed model output
+
+    Only text after "Message:" is shown (all of it when the output has no
+    marker), and structured lines (Symptoms:, SCHEDULE_EVENT:, ...) and prompt
+    echoes are hidden. Text before the marker is held back until the end, in
+    case there is no marker. A Symptoms: line before the marker means the
+    output is a symptom extraction, whose reply is generated locally, so
+    nothing is released for it unless show_extractions is set.
+    """
+
+    HIDDEN = ("Symptoms:", "Severity:", "SCHEDULE_EVENT:", "Title:", "Date:", "Time:", "You are a medical assistant")
+    MARKER = "Message:"  # removed, along with everything before it; the rest of its line is shown
+
+    def __init__(self, show_extractions=False):
+        self.show_extractions = show_extractions
+        self.line = ''  # start of the current line, held back until it can't be a marker
+        self.state = 'pending'
+        self.seen_marker = False
+        self.extraction = False
+        self.held = []  # visible text before the marker
+
+    def _emit(self, text, out):
+        if self.extraction and not self.show_extractions:
+            return
+        (out if self.seen_marker else self.held).append(text)
+
+    def feed(self, text):
+        out = []
+        for char in text:
+            if self.state == 'pending':
+                self.line += char
+                head = self.line.lstrip()
+                if head.startswith(self.MARKER):
+                    self.seen_marker = True
+                    self.held = []
+                    self.state = 'dropped'
+                    self.line = ''
+                elif any(head.startswith(m) for m in self.HIDDEN):
+                    if self.line.startswith("Symptoms:") and not self.seen_marker:
+                        self.extraction = True
+                    self.state = 'hidden'
+                    self.line = ''
+                elif char == '\n' or not any(m.startswith(head) for m in self.HIDDEN + (self.MARKER,)):
+                    self.state = 'visible'
+                    self._emit(self.line, out)
+                    self.line = ''
+            elif self.state == 'dropped' and not char.isspace():
+                self.state = 'visible'
+                self._emit(char, out)
+            elif self.state == 'visible':
+                self._emit(char, out)
+            if char == '\n':
+                self.state = 'pending'
+        return ''.join(out)
+
+    def flush(self):
+        out = []
+        if self.state == 'pending' and self.line:
+            self._emit(self.line, out)
+        self.line = ''
+        if not self.seen_marker:
+            out, self.held = self.held, []
+        return ''.join(out)
+
+    @classmethod
+    def visible_text(cls, text):
+        """The reply shown for a complete, non-extraction model output"""
+        display = cls(show_extractions=True)
+        return (display.feed(text) + display.flush()).strip()
+
 
 class Chatbot:
-    def __init__(self, api_key, places_api_key):
+    def __init__(self, api_key, places_api_key, symptom_index=None, places_client=None, session_store=None,
+                 llm_cache=None, model_policy=None, prefetcher=None, batch_runner=None, model_options=None,
+                 admission=None, calendar=None, conversation=None):
         self.api_key = api_key
+        self.model_options = model_options or {}  # Extra genai.configure() arguments (transport, client_options)
         self.places_api_key = places_api_key
-        self.setup_model()
-        self.user_symptoms = {}  # Store symptoms per user
-        self.user_severity = {}  # Store overall severity per user
-        self.last_interaction = {}  # Track last interaction time per user
-        self.last_recommended_doctor = {}  # Store last recommended doctor per user
-        self.awaiting_more_symptoms = {}  # Track if we're waiting for more symptoms
+        self.symptom_index = symptom_index or SymptomIndex.load_or_build()
+        self.diagnosis_engine = DiagnosisEngine(self.symptom_index)
+        self.symptom_extractor = SymptomExtractor(self.symptom_index)
+        self.intent_router = IntentRouter()
+        self.places_client = places_client or PlacesClient(places_api_key)
+        self.sessions = session_store or InMemorySessionStore()  # Per-user conversation state
+        self.llm_cache = llm_cache or LLMCache()
+        self.model_policy = model_policy or CallPolicy('gemini', timeout=15)  # Deadline, hedging, breaker
+        self.prefetcher = prefetcher or Prefetcher()  # Speculative specialist lookups, one per user
+        self.batch_runner = batch_runner or BatchRunner()
+        self.admission = admission or AdmissionController()  # Rate limits and load shedding for model calls
+        self.calendar = calendar or CalendarService()  # Appointments, for conflict checks when scheduling
+        self.conversation = conversation or ConversationContext(SYSTEM_PROMPT)  # Budgeted prompt context
+        self._model = None
+        self._model_pid = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """Gemini model, created lazily in each process so clients never cross a fork"""
+        if self._model is None or self._model_pid != os.getpid():
+            with self._model_lock:
+                if self._model is None or self._model_pid != os.getpid():
+                    self.setup_model()
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        self._model_pid = os.getpid()
 
     def setup_model(self):
         """Initialize the Gemini model with API key"""
         try:
-            genai.configure(api_key=self.api_key)
+            # The SDK pulls in grpc and protobuf, so it is only imported when a model is first needed
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key, **self.model_options)
             self.model = genai.GenerativeModel('gemini-2.0-flash')
             logger.info("Successfully initialized Gemini model")
         except Exception as e:
             logger.error(f"Error initializing model: {str(e)}")
             raise
 
+    def warm_up_model(self, background=True):
+        """Import the Gemini SDK and create the model ahead of the first LLM-bound request"""
+        def run():
+            try:
+                self.model
+            except Exception as e:
+                logger.warning(f"Model warm-up failed: {str(e)}")
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name='model-warm-up', daemon=True)
+        thread.start()
+        return thread
+
     def get_specialist_for_symptoms(self, symptoms):
         """Map symptoms to appropriate medical specialists"""
-        # Common symptom-to-specialist mappings
+        # Rank specialists from the compiled dataset index first
+        symptom_ids = self.symptom_index.lookup(symptoms)
+        if symptom_ids:
+            ranked = self.symptom_index.rank_specialists(symptom_ids)
+            if ranked:
+                return [specialist.lower() for specialist in ranked]
+
+        # Fall back to keyword mappings for symptoms outside the dataset vocabulary
         specialist_mappings = {
             'headache': ['neurologist', 'general physician'],
             'migraine': ['neurologist'],
@@ -73,29 +228,62 @@ class Chatbot:
 
         return list(recommended_specialists)
 
-    def find_nearby_specialist(self, specialist_type):
-        """Find nearby medical specialists using Google Places API"""
-        try:
-            # Handle different types of doctor searches
-            search_term = specialist_type.lower()
-            if search_term in ["general physician", "general practitioner", "primary care"]:
-                search_term = "family doctor"
-            elif "specialist" in search_term:
-                search_term = search_term.replace(" specialist", "")
-            
-            # Use default location (Newark, DE) for searches
-            query = f"{search_term} doctor in Newark, DE"
-            params = {
-                'query': query,
-                'key': self.places_api_key,
+    def specialist_search_term(self, specialist_type):
+        """Normalize a specialist type into the term used for Places searches"""
+        # Handle different types of doctor searches
+        search_term = specialist_type.lower()
+        if search_term in ["general physician", "general practitioner", "primary care"]:
+            search_term = "family doctor"
+        elif "specialist" in search_term:
+            search_term = search_term.replace(" specialist", "")
+        return search_term
+
+    def places_search_params(self, specialist_type, location=None):
+        """Build the Places text-search parameters for a specialist type"""
+        search_term = self.specialist_search_term(specialist_type)
+        if location:
+            return {
+                'query': f"{search_term} doctor",
                 'type': 'doctor',
-                'location': '39.6837,-75.7497',  # Newark, DE coordinates
-                'radius': '10000'  # 10km radius
+                'location': f"{location[0]:.6f},{location[1]:.6f}",
+                'radius': str(SEARCH_RADIUS_M)
             }
-            
-            response = requests.get(PLACES_API_URL, params=params)
-            response.raise_for_status()
-            results = response.json().get('results', [])
+
+        # Use default location (Newark, DE) for searches
+        return {
+            'query': f"{search_term} doctor in Newark, DE",
+            'type': 'doctor',
+            'location': '39.6837,-75.7497',  # Newark, DE coordinates
+            'radius': str(SEARCH_RADIUS_M)
+        }
+
+    def warm_up_places(self, background=True):
+        """Prefetch Places results for every specialist type we can recommend"""
+        specialist_types = ["family doctor"]
+        specialist_types += self.intent_router.intents['specialist']['phrases']
+        specialist_types += [specialist.lower() for specialist in self.symptom_index.specialists]
+        searches = {}
+        for specialist_type in specialist_types:
+            search_term = self.specialist_search_term(specialist_type)
+            searches.setdefault(search_term, (self.places_search_params(specialist_type), search_term))
+        return self.places_client.warm_up(list(searches.values()), background=background)
+
+    @metrics.timed('places')
+    def find_nearby_specialist(self, specialist_type, location=None):
+        """Find nearby medical specialists using Google Places API"""
+        try:
+            search_term = self.specialist_search_term(specialist_type)
+            with self.sessions.unlocked():
+                if location:
+                    # Serve from the spatial index of already-fetched places when the area is covered
+                    nearest = self.places_client.nearby(
+                        search_term, location[0], location[1],
+                        lambda lat, lng: self.places_search_params(specialist_type, (lat, lng)),
+                        radius=SEARCH_RADIUS_M
+                    )
+                    results = [place for place, _ in nearest]
+                else:
+                    results = self.places_client.text_search(self.places_search_params(specialist_type), group=search_term)
             
             if not results:
                 return None
@@ -111,6 +299,71 @@ class Chatbot:
             logger.error(f"Error finding specialist: {str(e)}")
             return None
 
+    def diagnosis_for(self, session):
+        """Return the session's diagnosis, restoring it if it was loaded in serialized form"""
+        if isinstance(session.diagnosis, dict):
+            session.diagnosis = self.diagnosis_engine.restore(session.diagnosis)
+        return session.diagnosis
+
+    def record_symptoms(self, session, symptoms, reset=False):
+        """Fold newly reported symptoms into the user's diagnosis session"""
+        if reset or self.diagnosis_for(session) is None:
+            session.diagnosis = self.diagnosis_engine.new_session()
+        session.diagnosis.observe_all(self.symptom_index.lookup(symptoms))
+        return session.diagnosis
+
+    @metrics.timed('diagnosis')
+    def follow_up_question(self, session, text):
+        """Append the most informative symptom to ask about next, if any"""
+        diagnosis = self.diagnosis_for(session)
+        if not diagnosis or not diagnosis.has_findings:
+            return text
+        symptom_id = diagnosis.next_question()
+        if symptom_id is None:
+            return text
+        diagnosis.pending_question = symptom_id
+        return f"{text} For example, do you also have {self.symptom_index.symptoms[symptom_id]}?"
+
+    def recommend_specialists(self, session, diagnosis=None):
+        """Recommend specialists from the cached posterior, falling back to keyword mapping"""
+        diagnosis = diagnosis or self.diagnosis_for(session)
+        if diagnosis and diagnosis.has_findings:
+            return [diagnosis.top_specialist().lower()]
+        if session.symptoms:
+            return self.get_specialist_for_symptoms(session.symptoms)
+        return []
+
+    def prefetch_specialist(self, session, location=None):
+        """Start the Places lookup for the specialist we expect to recommend once the user is done"""
+        diagnosis = self.diagnosis_for(session)
+        if diagnosis and diagnosis.pending_question is not None:
+            # The closing "no" also answers the pending question, so predict with it ruled out
+            diagnosis = diagnosis.copy()
+            diagnosis.observe(diagnosis.pending_question, present=False)
+        recommended_specialists = self.recommend_specialists(session, diagnosis)
+        if recommended_specialists:
+            specialist_type = recommended_specialists[0]
+            self.prefetcher.submit(session.user_id, (specialist_type, location),
+                                   self.find_nearby_specialist, specialist_type, location)
+
+    def nearby_specialist_for(self, session, specialist_type, location=None):
+        """Serve from the speculative lookup when it was made for this specialist and location"""
+        future = self.prefetcher.take(session.user_id, (specialist_type, location))
+        if future is not None:
+            with self.sessions.unlocked():
+                return future.result()
+        return self.find_nearby_specialist(specialist_type, location)
+
+    @metrics.timed('calendar')
+    def propose_appointment(self, user_id, start):
+        """Check start against the user's calendar without booking; returns (free start or None, conflicting events)"""
+        conflicts = self.calendar.conflicts_for(user_id, start, start + self.calendar.appointment)
+        if not conflicts:
+            return start, []
+        slots = self.calendar.free_slots(user_id, start, count=1)
+        return (slots[0] if slots else None), conflicts
+
+    @metrics.timed('parse_event_details')
     def parse_event_details(self, text):
         """Parse event details from AI response"""
         try:
@@ -137,6 +390,7 @@ class Chatbot:
             logger.error(f"Error parsing event details: {str(e)}")
             return None
 
+    @metrics.timed('extract_symptoms')
     def extract_symptoms(self, ai_response):
         """Extract symptoms from AI response"""
         try:
@@ -156,14 +410,8 @@ class Chatbot:
             logger.error(f"Error extracting symptoms: {str(e)}")
             return [], None
 
-    def should_ask_severity(self, user_id):
-        """Determine if we should ask for symptom severity"""
-        current_time = datetime.now()
-        return (user_id not in self.last_interaction or 
-                (current_time - self.last_interaction[user_id]).total_seconds() > 3600)
-
     def parse_time(self, message):
-        """Parse time from message"""
+        """Parse time from message, or None if it gives none"""
         try:
             # Look for time pattern like "1:14pm" or "2pm"
             time_pattern = r'(\d{1,2})(?::(\d{2}))?\s*(am|pm)'
@@ -182,16 +430,16 @@ class Chatbot:
                 
                 return f"{hour % 12 or 12}:{minutes:02d} {period}"
             
-            return "9:00 AM"  # Default time
+            return None
         except Exception as e:
             logger.error(f"Error parsing time: {str(e)}")
-            return "9:00 AM"
+            return None
 
     def parse_date(self, message):
-        """Parse date from message"""
+        """Parse date from message, or None if it gives no valid date"""
         try:
             # Look for date pattern like "3/8/25"
-            date_pattern = r'(\d{1,2})/(\d{1,2})/(\d{2}|\d{4})'
+            date_pattern = r'(\d{1,2})/(\d{1,2})/(\d{4}|\d{2})'
             match = re.search(date_pattern, message)
             
             if match:
@@ -207,61 +455,148 @@ class Chatbot:
                 try:
                     return datetime(year, month, day).strftime('%Y-%m-%d')
                 except ValueError:
-                    return datetime.now().strftime('%Y-%m-%d')
+                    return None
             
-            return datetime.now().strftime('%Y-%m-%d')  # Default to today
+            return None
         except Exception as e:
             logger.error(f"Error parsing date: {str(e)}")
-            return datetime.now().strftime('%Y-%m-%d')
+            return None
 
-    def generate_response(self, message, user_id="default"):
+    def model_cache_key(self, prompt):
+        """Cache key for a prompt built from the base template, or None if it carries session context"""
+        if not prompt.startswith(BASE_PROMPT):
+            return None
+        return f"{PROMPT_VERSION}:{normalize_message(prompt[len(BASE_PROMPT):])}"
+
+    def call_model(self, prompt, stream=False, visible=False, user_id='default'):
+        """Call the model, yielding display tokens while streaming; returns the full text
+
+        Cache hits are served directly; actual model calls go through admission
+        control and raise Overloaded (429) when shed. Admission waits and the
+        call itself run with the session released, so they hold up nobody else.
+        """
+        key = self.model_cache_key(prompt)
+        if key is None:
+            self.llm_cache.skip()
+        else:
+            cached = self.llm_cache.get(key)
+            if cached is not None:
+                metrics.UPSTREAM_CALLS.inc('gemini', 'cached')
+                if stream and visible:
+                    display = DisplayFilter()
+                    token = display.feed(cached) + display.flush()
+                    if token:
+                        # Never wait on the client with the session held
+                        with self.sessions.unlocked():
+                            yield token
+                return cached
+
+        # Fail fast while the breaker is open, so the caller's fallback runs without spending a token
+        self.model_policy.check_open()
+        start = time.perf_counter()
+        with self.sessions.unlocked(), self.admission.admit(user_id), metrics.span('llm'):
+            model = self.model
+            if not stream:
+                text = self.model_policy.call(lambda: model.generate_content(prompt).text)
+            else:
+                parts = []
+                display = DisplayFilter()
+                for chunk in self.model_policy.stream(model.generate_content, prompt, stream=True):
+                    parts.append(chunk.text)
+                    if visible:
+                        token = display.feed(chunk.text)
+                        if token:
+                            yield token
+                if visible:
+                    token = display.flush()
+                    if token:
+                        yield token
+                text = ''.join(parts)
+
+        if key is not None and text:
+            self.llm_cache.set(key, text, time.perf_counter() - start)
+        return text
+
+    def generate_response(self, message, user_id="default", location=None):
         """Generate a response using the Gemini model"""
+        replies = self.respond(message, user_id, location)
+        try:
+            while True:
+                next(replies)
+        except StopIteration as done:
+            return done.value
+
+    def stream_response(self, message, user_id="default", location=None):
+        """Generate a response as server-sent event payloads
+
+        Model output is streamed as 'token' events; deterministic replies go out
+        as a single 'message' event. A final 'done' event carries the complete
+        response and any parsed event_details. Tokens are yielded with the
+        session released, and the other events once it is saved, so a slow
+        reader never holds up the session.
+        """
+        replies = self.respond(message, user_id, location, stream=True)
+        streamed = False
+        try:
+            while True:
+                token = next(replies)
+                streamed = True
+                yield {'event': 'token', 'data': {'text': token}}
+        except StopIteration as done:
+            response = done.value
+
+        if not streamed:
+            yield {'event': 'message', 'data': {'text': response['text']}}
+        yield {'event': 'done', 'data': {'response': response['text'], 'event_details': response.get('event_details')}}
+
+    def respond(self, message, user_id="default", location=None, stream=False):
+        """Core response logic; a generator that yields streamed tokens and returns the response dict"""
+        with metrics.turn() as turn, self.sessions.transaction(user_id) as session:
+            response = yield from self.reply(session, message, location, stream)
+            if turn.intent not in UNRECORDED_INTENTS:
+                self.conversation.record(session, message, response['text'])
+            return response
+
+    def reply(self, session, message, location=None, stream=False):
+        """Respond to one message within the user's session transaction"""
         try:
             logger.info("Sending request to Gemini API")
-            self.last_interaction[user_id] = datetime.now()
-            
-            base_prompt = """You are a medical assistant. Keep responses under 2 sentences. Only include SCHEDULE_EVENT if the user explicitly asks to schedule an appointment with a specific doctor. For scheduling use:
-SCHEDULE_EVENT:
-Title: [title]
-Date: YYYY-MM-DD
-Time: HH:MM
+            session.last_interaction = datetime.now().timestamp()
 
-Message: """
+            # Classify the message in one pass; symptoms take precedence over small talk
+            with metrics.span('route'):
+                route = self.intent_router.route(message)
+                extraction = self.symptom_extractor.extract(message)
+            small_talk = (any(route.has(intent) for intent in ['greeting', 'thanks', 'goodbye'])
+                          and route.residual_words <= 2 and not extraction.symptoms
+                          and not any(route.has(intent) for intent in ['specialist', 'doctor', 'schedule'])
+                          and not (route.has('done') and session.awaiting_more_symptoms))
 
-            if self.should_ask_severity(user_id):
-                prompt = base_prompt
-            else:
-                symptoms = ', '.join(self.user_symptoms.get(user_id, []))
-                severity = self.user_severity.get(user_id, 'Not provided')
-                prompt = f"Previous: {symptoms} (Severity: {severity})\n{base_prompt}"
-
-            message_lower = message.lower().strip()
-            
             # Handle greetings, thanks, and goodbyes
-            greetings = ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"]
-            thanks = ["thank you", "thanks", "appreciate it", "thank"]
-            goodbyes = ["bye", "goodbye", "see you", "see ya"]
-            
-            if any(message_lower.startswith(greeting) for greeting in greetings):
+            if small_talk and route.has('greeting'):
+                metrics.tag_intent('greeting')
                 return {
                     'text': "Hello! How can I help you today?",
                     'event_details': None
                 }
             
-            if any(thank in message_lower for thank in thanks):
+            if small_talk and route.has('thanks'):
+                metrics.tag_intent('thanks')
                 return {
                     'text': "You're welcome!",
                     'event_details': None
                 }
                 
-            if any(goodbye in message_lower for goodbye in goodbyes):
+            if small_talk and route.has('goodbye'):
+                metrics.tag_intent('goodbye')
                 return {
                     'text': "Goodbye! Take care!",
                     'event_details': None
                 }
             
-            # Handle help command first
-            if message_lower == "help":
+            # Handle help command
+            if route.has('help'):
+                metrics.tag_intent('help')
                 help_text = """Here's how to use the cleric:
 
 
@@ -290,63 +625,89 @@ Try any of these commands - I'm here to help!"""
                 }
 
             # Check if we're waiting for more symptoms
-            if user_id in self.awaiting_more_symptoms and self.awaiting_more_symptoms[user_id]:
-                if any(word in message_lower for word in ['no', 'nope', "that's all", 'thats all', 'those are all']):
-                    self.awaiting_more_symptoms[user_id] = False
-                    # Get specialist recommendations based on all collected symptoms
-                    all_symptoms = self.user_symptoms.get(user_id, [])
-                    if all_symptoms:
-                        recommended_specialists = self.get_specialist_for_symptoms(all_symptoms)
-                        if recommended_specialists:
-                            specialist_info = self.find_nearby_specialist(recommended_specialists[0])
-                            if specialist_info:
-                                self.last_recommended_doctor[user_id] = specialist_info
-                                return {
-                                    'text': f"Based on your symptoms, I recommend seeing a {recommended_specialists[0]}. I found one nearby: {specialist_info['name']} at {specialist_info['address']}. Would you like me to schedule an appointment?",
-                                    'event_details': None
-                                }
+            if session.awaiting_more_symptoms:
+                diagnosis = self.diagnosis_for(session)
+                pending = diagnosis.pending_question if diagnosis else None
+
+                # A yes to the suggested symptom is recorded without another model call
+                if pending is not None and route.has('affirm'):
+                    metrics.tag_intent('affirm')
+                    diagnosis.observe(pending)
+                    session.symptoms = list(set(session.symptoms + [self.symptom_index.symptoms[pending]]))
+                    text = self.follow_up_question(session, "I've noted that symptom. Are there any other symptoms you'd like to mention?")
+                    self.prefetch_specialist(session, location)
                     return {
-                        'text': "I recommend seeing a general physician to evaluate your symptoms. Would you like me to find one nearby?",
+                        'text': text,
+                        'event_details': None
+                    }
+
+                if route.has('done') and not extraction.symptoms:
+                    metrics.tag_intent('done')
+                    session.awaiting_more_symptoms = False
+                    if pending is not None:
+                        diagnosis.observe(pending, present=False)
+                    # Get specialist recommendations from the cached posterior
+                    recommended_specialists = self.recommend_specialists(session)
+                    if recommended_specialists:
+                        specialist_info = self.nearby_specialist_for(session, recommended_specialists[0], location)
+                        if specialist_info:
+                            session.last_recommended_doctor = specialist_info
+                            return {
+                                'text': f"Based on your symptoms, I recommend seeing a {recommended_specialists[0]}. I found one nearby: {specialist_info['name']} at {specialist_info['address']}. Would you like me to schedule an appointment?",
+                                'event_details': None
+                            }
+                    return {
+                        'text': GENERAL_PHYSICIAN_FALLBACK,
                         'event_details': None
                     }
                 else:
-                    # Add new symptoms to the existing list
-                    response = self.model.generate_content(base_prompt + message)
-                    if response.text:
-                        new_symptoms, new_severity = self.extract_symptoms(response.text)
-                        if new_symptoms:
-                            current_symptoms = self.user_symptoms.get(user_id, [])
-                            self.user_symptoms[user_id] = list(set(current_symptoms + new_symptoms))
-                        if new_severity:
-                            self.user_severity[user_id] = new_severity
+                    metrics.tag_intent('more_symptoms')
+                    # Add new symptoms to the existing list, extracting locally when confident
+                    if self.symptom_extractor.accept(extraction):
+                        new_symptoms, new_severity = extraction.symptoms, extraction.severity
+                    else:
+                        try:
+                            prompt = self.conversation.build(session, message)
+                            response_text = yield from self.call_model(prompt, stream, user_id=session.user_id)
+                            new_symptoms, new_severity = self.extract_symptoms(response_text) if response_text else ([], None)
+                        except TooManyRequests:
+                            raise
+                        except Exception as e:
+                            if not self.symptom_extractor.usable(extraction):
+                                logger.warning(f"Model unavailable and local extraction not confident: {str(e)}")
+                                session.awaiting_more_symptoms = False
+                                return {
+                                    'text': GENERAL_PHYSICIAN_FALLBACK,
+                                    'event_details': None
+                                }
+                            logger.warning(f"Model unavailable, using local extraction: {str(e)}")
+                            new_symptoms, new_severity = extraction.symptoms, extraction.severity
+                    if new_symptoms:
+                        session.symptoms = list(set(session.symptoms + new_symptoms))
+                        self.record_symptoms(session, new_symptoms)
+                    if new_severity:
+                        session.severity = new_severity
+                    text = self.follow_up_question(session, "I've noted those additional symptoms. Are there any other symptoms you'd like to mention?")
+                    self.prefetch_specialist(session, location)
                     return {
-                        'text': "I've noted those additional symptoms. Are there any other symptoms you'd like to mention?",
+                        'text': text,
                         'event_details': None
                     }
 
-            # Check for doctor/specialist requests
-            specialist_types = [
-                "cardiologist", "neurologist", "dermatologist", "pediatrician",
-                "orthopedist", "gynecologist", "obstetrician", "psychiatrist",
-                "ophthalmologist", "urologist", "endocrinologist"
-            ]
+            # Check for doctor/specialist requests, specialists first
             doctor_type = None
-
-            # Check for specialists first
-            for specialist in specialist_types:
-                if specialist in message_lower:
-                    doctor_type = specialist
-                    break
-            
-            # Check for general doctor requests
-            if not doctor_type and any(term in message_lower for term in ["doctor", "physician"]):
+            specialist_match = route.first('specialist')
+            if specialist_match:
+                doctor_type = specialist_match.phrase
+            elif route.has('doctor'):
                 doctor_type = "family doctor"
 
             # Handle doctor search if applicable
             if doctor_type:
-                specialist_info = self.find_nearby_specialist(doctor_type)
+                metrics.tag_intent('doctor_search')
+                specialist_info = self.find_nearby_specialist(doctor_type, location)
                 if specialist_info:
-                    self.last_recommended_doctor[user_id] = specialist_info
+                    session.last_recommended_doctor = specialist_info
                     return {
                         'text': f"I found a {doctor_type} near you: {specialist_info['name']} at {specialist_info['address']}",
                         'event_details': None
@@ -358,18 +719,51 @@ Try any of these commands - I'm here to help!"""
                     }
 
             # Handle scheduling requests
-            if any(term in message.lower() for term in ["schedule", "appointment", "book"]) and "them" in message.lower():
-                if user_id in self.last_recommended_doctor:
-                    doctor = self.last_recommended_doctor[user_id]
+            if route.has('schedule') and route.has('referent'):
+                metrics.tag_intent('schedule')
+                if session.last_recommended_doctor:
+                    doctor = session.last_recommended_doctor
                     doctor_name = doctor['name'].split(',')[0]  # Get just the doctor/facility name
                     
                     # Parse date and time from message
                     date = self.parse_date(message)
                     time = self.parse_time(message)
-                    
-                    response_text = f"I'll help you schedule an appointment with {doctor_name}.\nSCHEDULE_EVENT:\nTitle: Appointment with {doctor_name}\nDate: {date}\nTime: {time}"
+                    if not date or not time:
+                        return {
+                            'text': f"When would you like to see {doctor_name}? Please include a date and time, for example: \"Schedule an appointment with them for 2:30 PM on 3/15/{(datetime.now().year + 1) % 100:02d}\"",
+                            'event_details': None
+                        }
+                    start = datetime.strptime(f"{date} {time}", '%Y-%m-%d %I:%M %p').timestamp()
+                    if start < datetime.now().timestamp():
+                        return {
+                            'text': f"{time} on {date} has already passed. Please suggest a later date and time.",
+                            'event_details': None
+                        }
+                    text = f"I'll help you schedule an appointment with {doctor_name}."
+
+                    # Only propose a time that is free; the client books it with POST /api/calendar,
+                    # which checks for conflicts again since the slot may be taken in the meantime
+                    title = f"Appointment with {doctor_name}"
+                    try:
+                        proposed, conflicts = self.propose_appointment(session.user_id, start)
+                    except Exception as e:
+                        logger.error(f"Calendar unavailable, proposing without a conflict check: {str(e)}")
+                        proposed, conflicts = start, []
+                    if conflicts:
+                        if proposed is None:
+                            text = f"You already have {conflicts[0].title} at {time} on {date}, and I couldn't find a free slot after it. Please suggest another time."
+                        else:
+                            free = datetime.fromtimestamp(proposed)
+                            text = (f"You already have {conflicts[0].title} at {time} on {date}. The next free slot is {format_time(free)} on {free.strftime('%Y-%m-%d')}. "
+                                    f"To book it, say \"Schedule an appointment with them for {format_time(free)} on {free.month}/{free.day}/{free.year}\".")
+                        return {
+                            'text': text,
+                            'event_details': None
+                        }
+
+                    response_text = f"{text}\nSCHEDULE_EVENT:\nTitle: {title}\nDate: {date}\nTime: {time}"
                     return {
-                        'text': f"I'll help you schedule an appointment with {doctor_name}.",
+                        'text': text,
                         'event_details': self.parse_event_details(response_text)
                     }
                 else:
@@ -378,46 +772,129 @@ Try any of these commands - I'm here to help!"""
                         'event_details': None
                     }
 
-            # Handle new symptoms
-            response = self.model.generate_content(base_prompt + message)
-            if not response.text:
-                raise ValueError("Empty response from Gemini")
-            
-            symptoms, severity = self.extract_symptoms(response.text)
+            # Handle new symptoms, skipping the model when the local extractor is confident
+            metrics.tag_intent('symptoms')
+            if self.symptom_extractor.accept(extraction):
+                symptoms, severity = extraction.symptoms, extraction.severity
+            else:
+                try:
+                    prompt = self.conversation.build(session, message)
+                    response_text = yield from self.call_model(prompt, stream, visible=True, user_id=session.user_id)
+                except TooManyRequests:
+                    raise
+                except Exception as e:
+                    # Fail fast to what we can work out locally
+                    logger.warning(f"Model unavailable, using local extraction: {str(e)}")
+                    if not self.symptom_extractor.usable(extraction):
+                        return {
+                            'text': GENERAL_PHYSICIAN_FALLBACK,
+                            'event_details': None
+                        }
+                    response_text = None
+                    symptoms, severity = extraction.symptoms, extraction.severity
+                else:
+                    if not response_text:
+                        raise ValueError("Empty response from Gemini")
+                    symptoms, severity = self.extract_symptoms(response_text)
+
             if symptoms:
-                self.user_symptoms[user_id] = symptoms
+                session.symptoms = symptoms
+                self.record_symptoms(session, symptoms, reset=True)
                 if severity:
-                    self.user_severity[user_id] = severity
-                self.awaiting_more_symptoms[user_id] = True
+                    session.severity = severity
+                session.awaiting_more_symptoms = True
+                text = self.follow_up_question(session, "I understand you're experiencing these symptoms. Are there any other symptoms you'd like to mention?")
+                self.prefetch_specialist(session, location)
                 return {
-                    'text': "I understand you're experiencing these symptoms. Are there any other symptoms you'd like to mention?",
+                    'text': text,
                     'event_details': None
                 }
             
             # If no symptoms found, just return the cleaned response
-            display_text = response.text
-            if "Message:" in display_text:
-                display_text = display_text.split("Message:")[1].strip()
-            display_text = display_text.replace("You are a medical assistant", "").strip()
-            display_text = display_text.replace("Keep responses under 2 sentences", "").strip()
+            metrics.tag_intent('general')
+            # Same filtering as the streamed tokens, so both show the same reply
+            display_text = DisplayFilter.visible_text(response_text) or response_text.strip()
 
             return {
                 'text': display_text,
                 'event_details': None
             }
 
+        except TooManyRequests:
+            raise
         except Exception as e:
             logger.error(f"Gemini API Error: {str(e)}")
             raise InternalServerError(f"Error generating response from AI model: {str(e)}")
 
-    def process_chat_request(self, data):
-        """Process a chat request and return a response"""
+    def readiness(self):
+        """Check that the components needed to serve requests are available"""
+        checks = {}
+        checks['symptom_index'] = len(self.symptom_index.symptoms) > 0
+        try:
+            self.sessions.stats()
+            checks['sessions'] = True
+        except Exception as e:
+            logger.error(f"Session store not ready: {str(e)}")
+            checks['sessions'] = False
+        checks['model_configured'] = bool(self.api_key)
+        return checks
+
+    def stats(self):
+        """Return runtime counters for the stats endpoint"""
+        return {
+            'symptom_extractor': self.symptom_extractor.stats(),
+            'places': self.places_client.stats(),
+            'sessions': self.sessions.stats(),
+            'llm_cache': self.llm_cache.stats(),
+            'prefetch': self.prefetcher.stats(),
+            'batch': self.batch_runner.stats(),
+            'admission': self.admission.stats(),
+            'calendar': self.calendar.stats(),
+            'conversation': self.conversation.stats(),
+            'upstreams': {
+                'gemini': self.model_policy.stats(),
+                'places': self.places_client.policy.stats(),
+            },
+        }
+
+    def parse_location(self, data):
+        """Read optional lat/lng coordinates from a request body"""
+        lat, lng = data.get('lat'), data.get('lng')
+        if lat is None and lng is None:
+            return None
+        try:
+            lat, lng = float(lat), float(lng)
+        except (TypeError, ValueError):
+            raise BadRequest("lat and lng must both be numbers")
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise BadRequest("lat/lng out of range")
+        return (lat, lng)
+
+    def parse_chat_request(self, data):
+        """Validate a chat request body and return (message, user_id, location)"""
         if not data.get('message'):
             logger.warning("No message provided in request")
             raise BadRequest("Message is required")
 
         message = data['message']
         user_id = data.get('user_id', 'default')
+        if not isinstance(message, str) or not isinstance(user_id, str):
+            raise BadRequest("message and user_id must be strings")
+        location = self.parse_location(data)
         logger.info(f"Processing message for user {user_id}: {message[:50]}...")
-        
-        return self.generate_response(message, user_id)
\ No newline at end of file
+        return message, user_id, location
+
+    def process_chat_request(self, data):
+        """Process a chat request and return a response"""
+        message, user_id, location = self.parse_chat_request(data)
+        return self.generate_response(message, user_id, location)
+
+    def stream_chat_request(self, data):
+        """Validate a chat request up front and return its server-sent event stream"""
+        message, user_id, location = self.parse_chat_request(data)
+        return self.stream_response(message, user_id, location)
+
+    def batch_chat_request(self, data):
+        """Validate a batch of chat requests up front and return a generator of per-item results"""
+        self.batch_runner.validate(data)
+        return self.batch_runner.run(data, self.process_chat_request)
\ No newline at end of file
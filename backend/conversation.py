@@ -0,0 +1,112 @@
+import logging
+import math
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rough characters per token for English text; close enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+
+PROMPT_TOKENS = metrics.REGISTRY.histogram('localcleric_prompt_tokens', 'Estimated tokens per model prompt', (),
+                                           buckets=(64, 128, 256, 384, 512, 768, 1024, 2048, 4096))
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def clip(text, max_chars):
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + '...'
+
+
+class ConversationContext:
+    """Builds model prompts from a session's recent turns within a token budget
+
+    Sessions keep their last max_turns exchanges. A prompt is the pre-built
+    system prefix, a one-line summary of the session's symptoms and severity
+    (which stands in for turns that have rolled off), as many recent turns as
+    fit in context_tokens (newest first), then the message. Prompt size is
+    therefore bounded however long the session runs. A session with no
+    history gets the plain template, so those prompts stay cacheable.
+    """
+
+    def __init__(self, system_prompt, message_marker="Message: ", max_turns=6, context_tokens=300,
+                 max_turn_chars=400):
+        self.system_prompt = system_prompt
+        self.message_marker = message_marker
+        self.max_turns = max_turns
+        self.context_tokens = context_tokens
+        self.max_turn_chars = max_turn_chars
+        # Fixed prompt text, assembled once
+        self.plain_prefix = system_prompt + message_marker
+        self.context_prefix = system_prompt + "Earlier in this conversation (for context only):\n"
+        self.prefix_tokens = estimate_tokens(self.plain_prefix)
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.with_context = 0
+        self.turns_dropped = 0  # Recent turns left out of a prompt for budget
+        self.total_tokens = 0
+        self.max_tokens = 0
+
+    def record(self, session, message, reply):
+        """Append one exchange to the session's bounded turn buffer"""
+        session.turns.append([clip(message, self.max_turn_chars), clip(reply, self.max_turn_chars)])
+        del session.turns[:-self.max_turns]
+
+    def summary(self, session, max_chars):
+        """Structured digest of what earlier turns established"""
+        parts = []
+        if session.symptoms:
+            parts.append(f"symptoms: {', '.join(session.symptoms)}")
+        if session.severity:
+            parts.append(f"severity: {session.severity}")
+        doctor = session.last_recommended_doctor
+        if doctor and doctor.get('name'):
+            parts.append(f"recommended doctor: {doctor['name']}")
+        if not parts:
+            return ''
+        return clip(f"Known so far - {'; '.join(parts)}", max_chars)
+
+    def build(self, session, message):
+        """Prompt for message in the context of the session, within the token budget"""
+        budget = self.context_tokens * CHARS_PER_TOKEN
+        summary = self.summary(session, budget // 2)
+        lines = []
+        used = len(summary)
+        turns = session.turns[::-1]
+        for user_text, reply_text in turns:
+            turn = f"User: {user_text}\nAssistant: {reply_text}"
+            if used + len(turn) > budget:
+                break
+            lines.append(turn)
+            used += len(turn)
+        lines.reverse()
+
+        if summary or lines:
+            context = '\n'.join(([summary] if summary else []) + lines)
+            prompt = f"{self.context_prefix}{context}\n\n{self.message_marker}{message}"
+        else:
+            prompt = self.plain_prefix + message
+
+        tokens = estimate_tokens(prompt)
+        PROMPT_TOKENS.observe(tokens)
+        with self._lock:
+            self.prompts += 1
+            self.with_context += bool(summary or lines)
+            self.turns_dropped += len(turns) - len(lines)
+            self.total_tokens += tokens
+            self.max_tokens = max(self.max_tokens, tokens)
+        return prompt
+
+    def stats(self):
+        with self._lock:
+            return {
+                'prompts': self.prompts,
+                'with_context': self.with_context,
+                'turns_dropped': self.turns_dropped,
+                'prefix_tokens': self.prefix_tokens,
+                'mean_tokens': self.total_tokens / self.prompts if self.prompts else 0.0,
+                'max_tokens': self.max_tokens,
+            }
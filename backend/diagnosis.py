@@ -0,0 +1,130 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _entropy(p, axis=0):
+    """Shannon entropy (nats) of probability vectors along an axis"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(p > 0, p * np.log(p), 0.0)
+    return -terms.sum(axis=axis)
+
+
+class DiagnosisEngine:
+    """Shared likelihood tables derived once from the symptom index
+
+    P(symptom | disease) comes from the dataset's co-occurrence frequencies with
+    additive smoothing, so a symptom never seen with a disease lowers its score
+    instead of ruling it out.
+    """
+
+    def __init__(self, symptom_index, alpha=0.5, floor=0.01):
+        self.index = symptom_index
+        rows = symptom_index.disease_rows.astype(np.float64)
+        counts = symptom_index.frequency.astype(np.float64) * rows[:, None]
+        likelihood = (counts + alpha) / (rows[:, None] + 2 * alpha)
+        self.likelihood = np.clip(likelihood, floor, 1 - floor)
+        self.log_present = np.log(self.likelihood)
+        self.log_absent = np.log1p(-self.likelihood)
+        self.log_prior = np.log(rows / rows.sum())
+        self.disease_specialist = symptom_index.disease_specialist.astype(np.intp)
+
+    def new_session(self):
+        return DiagnosisSession(self)
+
+    def restore(self, state):
+        """Rebuild a session from DiagnosisSession.to_state() output"""
+        session = DiagnosisSession(self)
+        for symptom_id, present in state.get('evidence', []):
+            session.observe(symptom_id, present)
+        session.pending_question = state.get('pending_question')
+        return session
+
+
+class DiagnosisSession:
+    """Per-user disease posterior, updated in O(diseases) per observed symptom"""
+
+    __slots__ = ('engine', 'log_posterior', 'evidence', 'pending_question')
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.log_posterior = engine.log_prior.copy()
+        self.evidence = {}  # symptom id -> present (True/False)
+        self.pending_question = None  # symptom id we last asked about
+
+    def observe(self, symptom_id, present=True):
+        """Fold one symptom observation into the posterior"""
+        if symptom_id in self.evidence:
+            return False
+        self.evidence[symptom_id] = present
+        if present:
+            self.log_posterior += self.engine.log_present[:, symptom_id]
+        else:
+            self.log_posterior += self.engine.log_absent[:, symptom_id]
+        if self.pending_question == symptom_id:
+            self.pending_question = None
+        return True
+
+    def observe_all(self, symptom_ids, present=True):
+        return sum(self.observe(symptom_id, present) for symptom_id in symptom_ids)
+
+    def copy(self):
+        clone = DiagnosisSession(self.engine)
+        clone.log_posterior = self.log_posterior.copy()
+        clone.evidence = dict(self.evidence)
+        clone.pending_question = self.pending_question
+        return clone
+
+    def to_state(self):
+        """Compact serializable form; the posterior is recomputed from the evidence"""
+        return {
+            'evidence': [[symptom_id, present] for symptom_id, present in self.evidence.items()],
+            'pending_question': self.pending_question,
+        }
+
+    @property
+    def has_findings(self):
+        return any(self.evidence.values())
+
+    def posterior(self):
+        shifted = np.exp(self.log_posterior - self.log_posterior.max())
+        return shifted / shifted.sum()
+
+    def top_diseases(self, n=3):
+        """Return the n most likely (disease, probability) pairs"""
+        posterior = self.posterior()
+        order = np.argsort(-posterior)[:n]
+        return [(self.engine.index.diseases[i], float(posterior[i])) for i in order]
+
+    def top_specialist(self):
+        """Return the specialist carrying the most posterior mass"""
+        mass = np.bincount(self.engine.disease_specialist, weights=self.posterior(),
+                           minlength=len(self.engine.index.specialists))
+        return self.engine.index.specialists[int(np.argmax(mass))]
+
+    def information_gain(self):
+        """Expected entropy reduction for asking about each symptom, in one vectorized pass"""
+        posterior = self.posterior()
+        likelihood = self.engine.likelihood
+
+        joint_present = posterior[:, None] * likelihood
+        joint_absent = posterior[:, None] * (1 - likelihood)
+        p_present = joint_present.sum(axis=0)
+        p_absent = 1 - p_present
+
+        entropy_present = _entropy(joint_present / p_present, axis=0)
+        entropy_absent = _entropy(joint_absent / p_absent, axis=0)
+        expected = p_present * entropy_present + p_absent * entropy_absent
+        return _entropy(posterior) - expected
+
+    def next_question(self, min_gain=1e-3):
+        """Pick the not-yet-observed symptom with the highest expected information gain"""
+        gain = self.information_gain()
+        if self.evidence:
+            gain[list(self.evidence)] = -np.inf
+        best = int(np.argmax(gain))
+        if not np.isfinite(gain[best]) or gain[best] < min_gain:
+            return None
+        return best
@@ -0,0 +1,172 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Intent table: phrases per intent, optionally anchored to the start of the
+# message ('start') or required to be the whole message ('full')
+DEFAULT_INTENTS = {
+    'greeting': {
+        'phrases': ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"],
+        'anchor': 'start',
+    },
+    'thanks': {
+        'phrases': ["thank you", "thanks", "appreciate it", "thank"],
+    },
+    'goodbye': {
+        'phrases': ["bye", "goodbye", "see you", "see ya"],
+    },
+    'help': {
+        'phrases': ["help"],
+        'anchor': 'full',
+    },
+    'done': {
+        'phrases': ["no", "nope", "that's all", "thats all", "that is all", "those are all", "nothing else"],
+    },
+    'affirm': {
+        'phrases': ["yes", "yeah", "yep", "yes i do", "i do"],
+        'anchor': 'full',
+    },
+    'specialist': {
+        'phrases': [
+            "cardiologist", "neurologist", "dermatologist", "pediatrician",
+            "orthopedist", "gynecologist", "obstetrician", "psychiatrist",
+            "ophthalmologist", "urologist", "endocrinologist"
+        ],
+    },
+    'doctor': {
+        'phrases': ["doctor", "physician"],
+    },
+    'schedule': {
+        'phrases': ["schedule", "appointment", "book"],
+    },
+    'referent': {
+        'phrases': ["them"],
+    },
+}
+
+# Words that do not count towards the unmatched remainder of a message
+STOPWORDS = {'a', 'an', 'the', 'i', 'me', 'you', 'it', 'so', 'much', 'very', 'all', 'ok', 'okay', 'there', 'for'}
+
+
+WORD = re.compile(r"[\w']+")
+
+
+def _residual_words(text, phrases):
+    words = WORD.findall(text)
+    matched = sum(phrase.count(' ') + 1 for phrase in phrases)
+    return max(len(words) - len(STOPWORDS.intersection(words)) - matched, 0)
+
+
+def _trie_pattern(phrases):
+    """Build a regex alternation factored by common prefix, so the engine rejects mismatches early"""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def render(node):
+        end = '' in node
+        branches = []
+        for char in sorted(c for c in node if c):
+            atom = r'\s+' if char == ' ' else re.escape(char)
+            branches.append(atom + render(node[char]))
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if end:
+            return f'(?:{body})?'
+        return body
+
+    return render(trie)
+
+
+class IntentMatch:
+    """One matched phrase and its span in the message"""
+
+    __slots__ = ('intent', 'phrase', 'start', 'end')
+
+    def __init__(self, intent, phrase, start, end):
+        self.intent = intent
+        self.phrase = phrase
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"IntentMatch({self.intent!r}, {self.phrase!r}, {self.start}, {self.end})"
+
+
+class RouteResult:
+    """Every intent matched in a message, plus how much of it was left unmatched"""
+
+    __slots__ = ('text', 'matches', '_residual_words')
+
+    def __init__(self, text, matches, residual_words=None):
+        self.text = text
+        self.matches = matches
+        self._residual_words = residual_words
+
+    @property
+    def residual_words(self):
+        """Number of non-stopword words not covered by any match, computed on first use"""
+        if self._residual_words is None:
+            self._residual_words = _residual_words(self.text, {(m.start, m.end): m.phrase for m in self.matches}.values())
+        return self._residual_words
+
+    def has(self, intent):
+        return any(match.intent == intent for match in self.matches)
+
+    def first(self, intent):
+        """Return the earliest match for an intent, or None"""
+        for match in self.matches:
+            if match.intent == intent:
+                return match
+        return None
+
+    @property
+    def intents(self):
+        return list(dict.fromkeys(match.intent for match in self.matches))
+
+    def __repr__(self):
+        return f"RouteResult({self.matches!r}, residual_words={self.residual_words})"
+
+
+class IntentRouter:
+    """Intent classifier compiled once into a single word-bounded regex
+
+    All phrases are folded into one prefix-factored alternation, so a single
+    finditer pass over the lowercased message yields every match and its span.
+    """
+
+    def __init__(self, intents=None):
+        self.intents = intents or DEFAULT_INTENTS
+        self.phrase_intents = {}  # phrase -> [(intent, anchor)]
+        for intent, spec in self.intents.items():
+            for phrase in spec['phrases']:
+                key = ' '.join(phrase.lower().split())
+                self.phrase_intents.setdefault(key, []).append((intent, spec.get('anchor')))
+
+        self.pattern = re.compile(rf"(?<![\w'])(?:{_trie_pattern(self.phrase_intents)})(?![\w'])")
+
+    def route(self, message):
+        """Match every intent in a message in one pass"""
+        text = message.lower().replace('’', "'").strip()
+        found = [(' '.join(m.group().split()), m.start(), m.end()) for m in self.pattern.finditer(text)]
+        residual_words = None
+
+        matches = []
+        for phrase, start, end in found:
+            for intent, anchor in self.phrase_intents[phrase]:
+                if anchor == 'start' and WORD.search(text, 0, start):
+                    continue
+                if anchor == 'full':
+                    # Must account for every phrase in the message and leave no residual words
+                    if residual_words is None:
+                        residual_words = _residual_words(text, [p for p, _, _ in found])
+                    if residual_words or any(intent not in dict(self.phrase_intents[p]) for p, _, _ in found):
+                        continue
+                matches.append(IntentMatch(intent, phrase, start, end))
+
+        return RouteResult(text, matches, residual_words)
@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Punctuation runs at the start or end of a word; keeps "that's", "2:30" and "3/15/25" intact
+EDGE_PUNCTUATION = re.compile(r"(?<!\w)[^\w\s]+|[^\w\s]+(?!\w)")
+
+
+def normalize_message(message):
+    """Canonical form of a user message for cache keys: case, spacing and stray punctuation removed"""
+    text = message.lower().replace('’', "'")
+    return ' '.join(EDGE_PUNCTUATION.sub(' ', text).split())
+
+
+class LLMCache:
+    """Cache for model responses: an in-memory LRU in front of an optional SQLite tier
+
+    Values carry the latency of the call that produced them, so every hit can be
+    credited with the time it saved. The SQLite tier survives restarts and is
+    shared by worker processes.
+    """
+
+    def __init__(self, max_entries=1024, ttl=7 * 24 * 3600, path=None, max_disk_entries=100000):
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.memory = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skipped = 0
+        self.saved_seconds = 0.0
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            conn = self._connection()
+            conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+            conn.commit()
+
+    def _connection(self):
+        """One connection per thread and process; connections are not shared across fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Return the cached text for a key, or None"""
+        entry = self.memory.get(key, count=False)
+        tier = 'memory'
+        if entry is None and self.path:
+            entry = self._disk_get(key)
+            tier = 'disk'
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            if tier == 'memory':
+                self.memory_hits += 1
+            else:
+                self.disk_hits += 1
+            self.saved_seconds += entry['latency']
+        return entry['text']
+
+    def _disk_get(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        except Exception as e:
+            logger.error(f"Error reading LLM cache: {str(e)}")
+            return None
+        if row is None or row[1] < time.time():
+            return None
+        entry = json.loads(row[0])
+        self.memory.set(key, entry, ttl=row[1] - time.time())  # Promote to the memory tier
+        return entry
+
+    def set(self, key, text, latency, ttl=None):
+        """Store a response along with the latency of the call that produced it"""
+        ttl = ttl or self.ttl
+        entry = {'text': text, 'latency': latency}
+        self.memory.set(key, entry, ttl=ttl)
+        with self._lock:
+            self.stores += 1
+            stores = self.stores
+        if self.path:
+            try:
+                conn = self._connection()
+                conn.execute("INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                             (key, json.dumps(entry), time.time() + ttl))
+                if stores % 100 == 0:
+                    self._evict(conn)
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error writing LLM cache: {str(e)}")
+
+    def _evict(self, conn):
+        conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        conn.execute("""DELETE FROM responses WHERE key IN (
+            SELECT key FROM responses ORDER BY expires_at DESC LIMIT -1 OFFSET ?)""", (self.max_disk_entries,))
+
+    def skip(self):
+        """Count a call that could not be cached (session-dependent prompt)"""
+        with self._lock:
+            self.skipped += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'stores': self.stores,
+                'skipped': self.skipped,
+                'saved_latency_ms': self.saved_seconds * 1000,
+                'entries': len(self.memory),
+            }
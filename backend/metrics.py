@@ -0,0 +1,314 @@
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from sub-millisecond local work up to slow model calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def merge(total, values):
+        for labels, value in values.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        values = self.snapshot() if values is None else values
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[position] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    @staticmethod
+    def merge(total, values):
+        for labels, series in values.items():
+            current = total.get(labels)
+            total[labels] = list(series) if current is None else [a + b for a, b in zip(current, series)]
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        values = self.snapshot() if values is None else values
+        for labels, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = bound if bound == '+Inf' else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Named metrics, rendered in Prometheus text format
+
+    Values live in the process that records them. Under a pre-fork server,
+    share() gives each process a file in a common directory: workers write
+    their values there every interval seconds, and a scrape of any worker
+    writes its own file and sums them all. Totals cover every worker
+    (including ones that have exited) and, since each file only ever grows,
+    never go backwards; other workers' counts may lag by up to interval.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.directory = None
+        self.interval = 1.0
+        self._flush_lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def _all(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def share(self, directory, interval=1.0):
+        """Aggregate across processes through per-process files in directory, clearing old ones"""
+        os.makedirs(directory, exist_ok=True)
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.json'):
+                os.remove(entry.path)
+        self.directory = directory
+        self.interval = interval
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def flush(self):
+        """Write this process's values to its file atomically, so scrapes never read a partial one"""
+        if self.directory is None:
+            return
+        path = self._path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        # Serialized so an older snapshot can never replace a newer one
+        with self._flush_lock:
+            stored = {metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+                      for metric in self._all()}
+            with open(tmp_path, 'w') as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, path)
+
+    def after_fork(self):
+        """Start a forked worker from zero (the parent's values are in the parent's file) and flush periodically"""
+        if self.directory is None:
+            return
+        for metric in self._all():
+            metric.reset()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Error writing metrics to {self.directory}: {str(e)}")
+
+    def _collect(self, metrics):
+        """Per-metric values summed over every process's file, this one's freshly written"""
+        self.flush()
+        by_name = {metric.name: metric for metric in metrics}
+        totals = {name: {} for name in by_name}
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path) as f:
+                    stored = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping metrics file {entry.path}: {str(e)}")
+                continue
+            for name, samples in stored.items():
+                metric = by_name.get(name)
+                if metric is not None:
+                    metric.merge(totals[name], {tuple(labels): value for labels, value in samples})
+        return totals
+
+    def render(self):
+        """Prometheus text exposition format"""
+        metrics = self._all()
+        totals = self._collect(metrics) if self.directory else {}
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(totals.get(metric.name)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram('localcleric_http_request_duration_seconds',
+                                     'HTTP request latency by endpoint', ('endpoint', 'method', 'status'))
+TURN_SECONDS = REGISTRY.histogram('localcleric_chat_turn_duration_seconds',
+                                  'Chat turn latency by handled intent', ('intent',))
+STAGE_SECONDS = REGISTRY.histogram('localcleric_stage_duration_seconds',
+                                   'Time spent in each stage of a chat turn', ('stage',))
+UPSTREAM_CALLS = REGISTRY.counter('localcleric_upstream_calls_total',
+                                  'Outbound calls by upstream and outcome', ('upstream', 'outcome'))
+ERRORS = REGISTRY.counter('localcleric_errors_total', 'Errors by stage', ('stage',))
+
+
+class Timings:
+    """Stage durations collected for one request, for the Server-Timing header"""
+
+    __slots__ = ('start', 'stages')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}  # stage -> seconds, summed over repeated spans
+
+
+class Turn:
+    """The intent that handled one chat turn"""
+
+    __slots__ = ('intent',)
+
+    def __init__(self):
+        self.intent = 'unknown'
+
+
+_current = contextvars.ContextVar('localcleric_timings', default=None)
+_turn = contextvars.ContextVar('localcleric_turn', default=None)
+
+
+def start_request():
+    timings = Timings()
+    _current.set(timings)
+    return timings
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def span(stage):
+    """Time a block into the stage histogram and the current request's timings"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        timings = _current.get()
+        if timings is not None:
+            timings.stages[stage] = timings.stages.get(stage, 0.0) + elapsed
+
+
+def timed(stage):
+    """Decorator form of span()"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def turn():
+    """Time a chat turn into the per-intent histogram; tag_intent() labels it"""
+    start = time.perf_counter()
+    current_turn = Turn()
+    previous = _turn.get()
+    _turn.set(current_turn)
+    try:
+        yield current_turn
+    finally:
+        _turn.set(previous)
+        TURN_SECONDS.observe(time.perf_counter() - start, current_turn.intent)
+
+
+def tag_intent(intent):
+    """Record which intent handled the current chat turn"""
+    current_turn = _turn.get()
+    if current_turn is not None:
+        current_turn.intent = intent
+
+
+def server_timing(timings):
+    """Format timings as a Server-Timing header value (durations in milliseconds)"""
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.stages.items()]
+    parts.append(f"total;dur={(time.perf_counter() - timings.start) * 1000:.1f}")
+    return ', '.join(parts)
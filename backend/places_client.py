@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from cache import TTLCache
+from resilience import CallPolicy
+from spatial_index import SpatialIndex, haversine_m
+
+logger = logging.getLogger(__name__)
+
+PLACES_API_URL = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+
+
+class PlacesClient:
+    """Google Places text search with pooled connections, caching and request coalescing
+
+    Identical concurrent searches share one upstream call (single flight), and
+    results are kept in a TTL+LRU cache that can persist across restarts.
+    Searches tagged with a group (specialist type) also feed a spatial index,
+    so location-based lookups can be answered locally once an area is covered.
+    Upstream calls go through a CallPolicy (deadline, hedging, circuit breaker).
+    """
+
+    def __init__(self, api_key, url=PLACES_API_URL, timeout=5, cache_ttl=24 * 3600,
+                 cache_size=512, cache_path=None, pool_size=10, spatial_index=None, policy=None):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.cache = TTLCache(max_entries=cache_size, ttl=cache_ttl, path=cache_path)
+        self._session = None
+        self._session_pid = None
+        self._inflight = {}  # cache key -> Future
+        self._lock = threading.Lock()
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.coalesced = 0
+        self.upstream_seconds = 0.0
+        self.upstream_max_seconds = 0.0
+        self.index_answers = 0
+        self.spatial_index = spatial_index or SpatialIndex()
+        self.policy = policy or CallPolicy('places', timeout=timeout)
+        for _, entry in self.cache.items():
+            if entry.get('group'):
+                self._index_results(entry['group'], entry['params'], entry['results'])
+
+    @property
+    def session(self):
+        """Keep-alive session, recreated in each process so pooled sockets are never shared"""
+        if self._session is None or self._session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+            self._session_pid = os.getpid()
+        return self._session
+
+    @staticmethod
+    def cache_key(params):
+        return json.dumps({k: v for k, v in params.items() if k != 'key'}, sort_keys=True)
+
+    def text_search(self, params, group=None):
+        """Return the results list for a text search, served from cache when possible"""
+        key = self.cache_key(params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            metrics.UPSTREAM_CALLS.inc('places', 'cached')
+            return cached['results']
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                # A previous leader may have filled the cache since our lookup
+                cached = self.cache.get(key, count=False)
+                if cached is not None:
+                    return cached['results']
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            results = self.policy.call(self._fetch, params)
+            entry = {'results': results, 'group': group, 'params': {k: v for k, v in params.items() if k != 'key'}}
+            self.cache.set(key, entry)
+            if group:
+                self._index_results(group, entry['params'], results)
+            future.set_result(results)
+            return results
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _fetch(self, params):
+        start = time.perf_counter()
+        try:
+            response = self.session.get(self.url, params={**params, 'key': self.api_key}, timeout=self.timeout)
+            response.raise_for_status()
+            payload = response.json()
+            status = payload.get('status', 'OK')
+            if status not in ('OK', 'ZERO_RESULTS'):
+                raise RuntimeError(f"Places API returned status {status}")
+            return payload.get('results', [])
+        except Exception:
+            with self._lock:
+                self.upstream_errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.upstream_calls += 1
+                self.upstream_seconds += elapsed
+                self.upstream_max_seconds = max(self.upstream_max_seconds, elapsed)
+
+    def _index_results(self, group, params, results):
+        self.spatial_index.add(group, results)
+        if params.get('location'):
+            lat, lng = (float(value) for value in params['location'].split(','))
+            self.spatial_index.mark_covered(group, lat, lng, float(params.get('radius', 10000)))
+
+    def nearby(self, group, lat, lng, build_params, radius=10000, k=1):
+        """Return up to k (place, distance_m) pairs near a point
+
+        Answered from the spatial index when the area is already covered for this
+        group; otherwise one upstream search is made around the center of the
+        point's grid cell, so nearby users share cache entries too. When none of
+        the places found lie within radius (or carry no location), the upstream
+        results are returned in their own ranking order instead.
+        """
+        if self.spatial_index.is_covered(group, lat, lng, radius):
+            found = self.spatial_index.nearest(group, lat, lng, k, radius)
+            if found:
+                with self._lock:
+                    self.index_answers += 1
+                metrics.UPSTREAM_CALLS.inc('places', 'index')
+                return found
+        center_lat, center_lng = self.spatial_index.cell_center(lat, lng)
+        try:
+            results = self.text_search(build_params(center_lat, center_lng), group=group)
+        except Exception as e:
+            # Upstream unavailable: settle for whatever is indexed nearby, even if the area is only partly covered
+            found = self.spatial_index.nearest(group, lat, lng, k, radius)
+            if not found:
+                raise
+            logger.warning(f"Places search failed, answering from the spatial index: {str(e)}")
+            return found
+        found = self.spatial_index.nearest(group, lat, lng, k, radius)
+        if found:
+            return found
+        return [(place, self._distance_m(place, lat, lng)) for place in results[:k]]
+
+    @staticmethod
+    def _distance_m(place, lat, lng):
+        location = (place.get('geometry') or {}).get('location') or {}
+        if 'lat' not in location or 'lng' not in location:
+            return None
+        return float(haversine_m(lat, lng, location['lat'], location['lng']))
+
+    def warm_up(self, searches, background=True):
+        """Prefetch a list of (params, group) searches, by default on a daemon thread"""
+        def run():
+            for params, group in searches:
+                try:
+                    self.text_search(params, group=group)
+                except Exception as e:
+                    logger.warning(f"Places warm-up failed for {params.get('query')}: {str(e)}")
+            logger.info(f"Places warm-up finished ({len(searches)} searches)")
+
+        if not background:
+            run()
+            # Leave no deferred-save thread behind, e.g. before the pre-fork server forks
+            self.cache.flush()
+            return None
+        thread = threading.Thread(target=run, name='places-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._lock:
+            calls = self.upstream_calls
+            stats = {
+                'upstream_calls': calls,
+                'upstream_errors': self.upstream_errors,
+                'coalesced': self.coalesced,
+                'upstream_latency_avg_ms': self.upstream_seconds / calls * 1000 if calls else 0.0,
+                'upstream_latency_max_ms': self.upstream_max_seconds * 1000,
+                'index_answers': self.index_answers,
+            }
+        stats['cache'] = self.cache.stats()
+        stats['spatial_index'] = self.spatial_index.stats()
+        stats['policy'] = self.policy.stats()
+        return stats
@@ -0,0 +1,99 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Speculative background lookups, at most one per key
+
+    Each key (a user) holds one in-flight or finished lookup tagged with what it
+    was computed for. submit() replaces it when the tag changes; take() hands the
+    future back only if the tag still matches, so a stale guess is never served.
+    The pool is bounded and speculation is skipped when it is saturated.
+    """
+
+    def __init__(self, max_workers=4, max_pending=32, max_entries=1024):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (tag, future)
+        self._pending = 0
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.refreshed = 0
+        self.skipped = 0
+        self.hits = 0
+        self.waits = 0
+        self.stale = 0
+        self.misses = 0
+
+    @property
+    def executor(self):
+        """Worker pool, recreated in each process since threads do not survive fork"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='prefetch')
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def submit(self, key, tag, fn, *args):
+        """Start fn(*args) for key unless a lookup with the same tag is already there"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == tag:
+                return entry[1]
+            if self._pending >= self.max_pending:
+                self.skipped += 1
+                return None
+            self._pending += 1
+            self.submitted += 1
+            self.refreshed += entry is not None
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        with self._lock:
+            self._entries[key] = (tag, future)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def take(self, key, tag):
+        """Remove and return the lookup for key if it was made for tag, else None"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != tag:
+                self.stale += 1
+                return None
+            if entry[1].done():
+                self.hits += 1
+            else:
+                self.waits += 1
+            return entry[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'pending': self._pending,
+                'submitted': self.submitted,
+                'refreshed': self.refreshed,
+                'skipped': self.skipped,
+                'hits': self.hits,
+                'waits': self.waits,
+                'stale': self.stale,
+                'misses': self.misses,
+            }
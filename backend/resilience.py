@@ -0,0 +1,255 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class UpstreamError(Exception):
+    """An outbound call was not attempted or did not finish in time"""
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class DeadlineExceeded(UpstreamError):
+    pass
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker
+
+    Opens after failure_threshold consecutive failures and rejects calls until
+    reset_timeout has passed; then a single probe call is let through, which
+    closes the breaker on success or re-opens it on failure.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                return True
+            return False
+
+    def rejecting(self):
+        """Whether allow() would refuse a call right now, without claiming the half-open probe"""
+        with self._lock:
+            if self.state == 'open':
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == 'half_open'
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.opens += 1
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.failures, 'opens': self.opens}
+
+
+class CallPolicy:
+    """Deadline, hedging and circuit breaking for one upstream
+
+    Calls run on a small per-process thread pool so the caller can stop waiting
+    at the deadline even when the client library has no timeout of its own. Once
+    enough latencies are known, a call still running after the p95 latency gets
+    a second (hedged) attempt and whichever finishes first wins.
+    """
+
+    def __init__(self, name, timeout=10.0, hedge=True, hedge_percentile=95, min_hedge_delay=0.05,
+                 min_samples=20, window=200, max_workers=16, breaker=None):
+        self.name = name
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies = deque(maxlen=window)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def executor(self):
+        """Worker pool, recreated in each process since threads do not survive fork"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix=f'{self.name}-call')
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None until enough latencies are known"""
+        with self._lock:
+            if not self.hedge or len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        position = min(int(len(ordered) * self.hedge_percentile / 100), len(ordered) - 1)
+        # Abandoned attempts still report their latency, so keep the delay well inside the deadline
+        return min(max(ordered[position], self.min_hedge_delay), self.timeout / 2)
+
+    def _attempt(self, fn, args, kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def _admit(self):
+        with self._lock:
+            self.calls += 1
+        if not self.breaker.allow():
+            self._reject()
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+        metrics.UPSTREAM_CALLS.inc(self.name, 'rejected')
+        raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def check_open(self):
+        """Raise CircuitOpenError if the breaker would reject a call, before any other cost is paid"""
+        if self.breaker.rejecting():
+            self._reject()
+
+    def _succeeded(self):
+        self.breaker.record_success()
+        metrics.UPSTREAM_CALLS.inc(self.name, 'ok')
+
+    def _failed(self, timed_out=False):
+        self.breaker.record_failure()
+        metrics.UPSTREAM_CALLS.inc(self.name, 'timeout' if timed_out else 'error')
+        with self._lock:
+            self.failures += 1
+            self.timeouts += timed_out
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn with the deadline, hedging and breaker applied; raises UpstreamError or fn's error"""
+        self._admit()
+        deadline = time.monotonic() + self.timeout
+        delay = self.hedge_delay()
+        primary = self.executor.submit(self._attempt, fn, args, kwargs)
+        pending = {primary}
+        hedged = None
+        error = None
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            timeout = remaining
+            if hedged is None and delay is not None:
+                timeout = min(remaining, max(delay - (self.timeout - remaining), 0))
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self._succeeded()
+                    if future is hedged:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+            if hedged is None and delay is not None and pending and not done:
+                hedged = self.executor.submit(self._attempt, fn, args, kwargs)
+                pending.add(hedged)
+                with self._lock:
+                    self.hedges += 1
+
+        if pending:
+            for future in pending:
+                future.cancel()
+            self._failed(timed_out=True)
+            raise DeadlineExceeded(f"{self.name} call exceeded {self.timeout}s")
+        self._failed()
+        raise error
+
+    def stream(self, fn, *args, **kwargs):
+        """Iterate a streaming call, applying the deadline to the whole stream (no hedging)"""
+        self._admit()
+        deadline = time.monotonic() + self.timeout
+        try:
+            iterator = iter(self._wait(self.executor.submit(fn, *args, **kwargs), deadline))
+            while True:
+                chunk = self._wait(self.executor.submit(next, iterator, _END), deadline)
+                if chunk is _END:
+                    break
+                yield chunk
+        except GeneratorExit:
+            self.breaker.record_success()  # The caller stopped early, but the upstream was answering
+            raise
+        except DeadlineExceeded:
+            self._failed(timed_out=True)
+            raise
+        except Exception:
+            self._failed()
+            raise
+        self._succeeded()
+
+    def _wait(self, future, deadline):
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            raise DeadlineExceeded(f"{self.name} call exceeded {self.timeout}s")
+
+    def stats(self):
+        delay = self.hedge_delay()
+        with self._lock:
+            stats = {
+                'calls': self.calls,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'hedge_delay_ms': delay * 1000 if delay is not None else None,
+            }
+        stats['breaker'] = self.breaker.stats()
+        return stats
+
+
+def create_call_policy(name, config, timeout):
+    """Build a CallPolicy from an optional per-upstream config section"""
+    options = dict(config or {})
+    breaker = CircuitBreaker(failure_threshold=options.pop('failure_threshold', 5),
+                             reset_timeout=options.pop('reset_timeout', 30.0))
+    return CallPolicy(name, timeout=options.pop('timeout', timeout), breaker=breaker, **options)
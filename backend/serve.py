@@ -0,0 +1,114 @@
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from gunicorn.app.base import BaseApplication
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LocalClericServer(BaseApplication):
+    """Pre-fork gunicorn server for the Flask app
+
+    The app (symptom index, Places cache, session store) is loaded once in the
+    master and shared copy-on-write with the workers; network clients are
+    created lazily inside each worker. Since workers are forked from that
+    loaded app, SIGHUP does not reread config or code; SIGUSR2 re-executes
+    the master, which does.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app
+        return app
+
+
+def on_starting(server):
+    logger.info("Starting Local Cleric server")
+
+
+def pre_fork(server, worker):
+    # Move startup objects out of the collector's generations so that GC passes in
+    # the workers do not touch (and un-share) their pages
+    gc.freeze()
+    # Values recorded during startup belong to the master's file; workers start from zero
+    metrics.REGISTRY.flush()
+
+
+def post_fork(server, worker):
+    logger.info(f"Worker {worker.pid} started")
+    metrics.REGISTRY.after_fork()
+    from app import config, chatbot
+    if config['gemini'].get('warm_up', True):
+        chatbot.warm_up_model()
+
+
+def worker_exit(server, worker):
+    # Keep the worker's final counts in the totals after it is gone
+    metrics.REGISTRY.flush()
+
+
+def default_workers():
+    return multiprocessing.cpu_count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Local Cleric backend with gunicorn")
+    parser.add_argument('--bind', default=os.environ.get('LOCALCLERIC_BIND', '0.0.0.0:5003'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('LOCALCLERIC_WORKERS', default_workers())))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('LOCALCLERIC_THREADS', 8)))
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('LOCALCLERIC_TIMEOUT', 120)))
+    parser.add_argument('--pid', default=os.environ.get('LOCALCLERIC_PIDFILE'),
+                        help="Master pid file; during a SIGUSR2 upgrade the new master writes <pid>.2")
+    args = parser.parse_args()
+
+    # Tells app.py to finish startup work synchronously before workers are forked,
+    # and how many processes will need to share state
+    os.environ['LOCALCLERIC_PREFORK'] = '1'
+    os.environ['LOCALCLERIC_WORKERS'] = str(args.workers)
+    logging.basicConfig(level=logging.INFO)
+
+    # Each worker records metrics in its own memory; /metrics merges them through this directory
+    metrics_dir = os.environ.get('LOCALCLERIC_METRICS_DIR')
+    temporary = metrics_dir is None
+    if temporary:
+        metrics_dir = tempfile.mkdtemp(prefix='localcleric-metrics-')
+    metrics.REGISTRY.share(metrics_dir)
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',  # Requests mostly wait on Gemini and Places
+        'timeout': args.timeout,
+        'graceful_timeout': 30,
+        'keepalive': 5,
+        'preload_app': True,
+        'pidfile': args.pid,
+        'on_starting': on_starting,
+        'pre_fork': pre_fork,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+    try:
+        LocalClericServer(options).run()
+    finally:
+        if temporary:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
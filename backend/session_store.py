@@ -0,0 +1,423 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('localcleric_session_transaction', default=None)
+
+
+class Session:
+    """Conversation state for one user"""
+
+    __slots__ = ('user_id', 'symptoms', 'severity', 'last_interaction', 'last_recommended_doctor',
+                 'awaiting_more_symptoms', 'diagnosis', 'turns', 'updated_at')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.symptoms = []  # Symptoms reported so far
+        self.severity = None  # Overall severity, as reported
+        self.last_interaction = None  # Epoch seconds of the previous message
+        self.last_recommended_doctor = None  # Places result we last recommended
+        self.awaiting_more_symptoms = False  # Whether we're waiting for more symptoms
+        self.diagnosis = None  # DiagnosisSession, or its serialized state until restored
+        self.turns = []  # Recent [message, reply] pairs, oldest first, bounded by ConversationContext
+        self.updated_at = time.time()
+
+    def to_dict(self):
+        diagnosis = self.diagnosis
+        if diagnosis is not None and hasattr(diagnosis, 'to_state'):
+            diagnosis = diagnosis.to_state()
+        return {
+            'symptoms': self.symptoms,
+            'severity': self.severity,
+            'last_interaction': self.last_interaction,
+            'last_recommended_doctor': self.last_recommended_doctor,
+            'awaiting_more_symptoms': self.awaiting_more_symptoms,
+            'diagnosis': diagnosis,
+            'turns': self.turns,
+            'updated_at': self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, user_id, data):
+        session = cls(user_id)
+        for field in cls.__slots__[1:]:
+            if field in data:
+                setattr(session, field, data[field])
+        return session
+
+    def approx_size(self):
+        """Rough memory footprint in bytes, used for the store's size cap"""
+        size = sys.getsizeof(self) + sum(len(symptom) + 50 for symptom in self.symptoms)
+        if self.last_recommended_doctor:
+            size += sum(len(str(value)) + 50 for value in self.last_recommended_doctor.values())
+        size += sum(len(message) + len(reply) + 100 for message, reply in self.turns)
+        if self.diagnosis is not None:
+            size += 1024
+        return size
+
+
+class _Hold:
+    """The session a transaction is working on, and whether it currently holds it"""
+
+    __slots__ = ('store', 'session', 'held')
+
+    def __init__(self, store, session):
+        self.store = store
+        self.session = session
+        self.held = True
+
+
+class SessionStore:
+    """Base class: per-user transactions over a bounded session backend
+
+    transaction() yields the user's (possibly new) session and saves it on
+    exit, serializing concurrent requests for the same user with a striped
+    lock plus whatever the backend uses to keep other processes out. Slow work
+    inside a transaction (model and Places calls) runs within unlocked(), which
+    saves and releases the session for the duration and reloads it afterwards,
+    so other users on the stripe are never held up by it.
+    """
+
+    LOCK_STRIPES = 64
+
+    def __init__(self, ttl=24 * 3600, max_sessions=10000, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def put(self, session):
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+    def get_or_create(self, user_id):
+        return self.get(user_id) or Session(user_id)
+
+    def _begin(self):
+        """Keep other processes from changing sessions until _end(); a no-op for process-local stores"""
+
+    def _end(self):
+        pass
+
+    def _open(self, user_id):
+        lock = self._locks[hash(user_id) % self.LOCK_STRIPES]
+        lock.acquire()
+        try:
+            self._begin()
+            try:
+                return self.get_or_create(user_id)
+            except BaseException:
+                self._end()
+                raise
+        except BaseException:
+            lock.release()
+            raise
+
+    def _close(self, session, save):
+        try:
+            if save:
+                session.updated_at = time.time()
+                self.put(session)
+        finally:
+            try:
+                self._end()
+            finally:
+                self._locks[hash(session.user_id) % self.LOCK_STRIPES].release()
+
+    @contextmanager
+    def transaction(self, user_id):
+        hold = _Hold(self, self._open(user_id))
+        previous = _current.get()
+        _current.set(hold)
+        try:
+            yield hold.session
+        except BaseException:
+            if hold.held:
+                self._close(hold.session, save=False)
+            raise
+        else:
+            self._close(hold.session, save=True)
+        finally:
+            _current.set(previous)
+
+    @contextmanager
+    def unlocked(self):
+        """Within transaction(), save and release the session for the block, then reload it
+
+        Changes another request saved meanwhile are picked up; outside a
+        transaction this does nothing.
+        """
+        hold = _current.get()
+        if hold is None or hold.store is not self or not hold.held:
+            yield
+            return
+        session = hold.session
+        hold.held = False
+        self._close(session, save=True)
+        try:
+            yield
+        finally:
+            fresh = self._open(session.user_id)
+            hold.held = True
+            if fresh is not session:
+                for field in Session.__slots__[1:]:
+                    setattr(session, field, getattr(fresh, field))
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store with TTL expiry, LRU eviction and a memory cap"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions = OrderedDict()  # user_id -> (session, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return None
+            if entry[0].updated_at < time.time() - self.ttl:
+                self._remove(user_id)
+                self.expirations += 1
+                return None
+            self._sessions.move_to_end(user_id)
+            return entry[0]
+
+    def put(self, session):
+        size = session.approx_size()
+        with self._lock:
+            if session.user_id in self._sessions:
+                self._remove(session.user_id)
+            self._sessions[session.user_id] = (session, size)
+            self._bytes += size
+            self._evict()
+
+    def delete(self, user_id):
+        with self._lock:
+            if user_id in self._sessions:
+                self._remove(user_id)
+
+    def _remove(self, user_id):
+        _, size = self._sessions.pop(user_id)
+        self._bytes -= size
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        while self._sessions:
+            user_id, (session, _) = next(iter(self._sessions.items()))
+            if session.updated_at < cutoff:
+                self.expirations += 1
+            elif len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes:
+                self.evictions += 1
+            else:
+                break
+            self._remove(user_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'sessions': len(self._sessions),
+                'bytes': self._bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite-backed store (WAL mode) shared by worker processes
+
+    Writes go straight to the database by default, so the next turn sees them
+    whichever worker serves it, and each transaction's read and write run in
+    one BEGIN IMMEDIATE database transaction, so requests in other processes
+    cannot interleave with it. With flush_interval > 0 writes are instead
+    buffered and flushed in batches by a background thread; reads see this
+    process's pending writes first, but other processes observe a write only
+    after up to flush_interval seconds, so batching is only safe when a user's
+    requests always reach the same process.
+    """
+
+    def __init__(self, path, flush_interval=0, batch_size=64, evict_interval=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.evict_interval = evict_interval
+        self._last_evict = 0.0
+        self._local = threading.local()
+        self._pending = OrderedDict()  # user_id -> serialized session
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher = None
+        self._flusher_pid = None
+        self.flushes = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("""CREATE TABLE IF NOT EXISTS sessions (
+            user_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        conn.commit()
+        atexit.register(self.flush)
+
+    def _connection(self):
+        """One connection per thread and process; connections are not shared across fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _begin(self):
+        if self.flush_interval <= 0:
+            conn = self._connection()
+            if conn.in_transaction:
+                conn.commit()
+            conn.execute("BEGIN IMMEDIATE")
+
+    def _end(self):
+        # A successful put() has committed already; anything still open failed part way
+        conn = self._connection()
+        if conn.in_transaction:
+            conn.rollback()
+
+    def _ensure_flusher(self):
+        if self.flush_interval <= 0:
+            return
+        if self._flusher is None or self._flusher_pid != os.getpid() or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, name='session-flusher', daemon=True)
+            self._flusher_pid = os.getpid()
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing sessions: {str(e)}")
+
+    def get(self, user_id):
+        with self._lock:
+            pending = self._pending.get(user_id)
+        if pending is None:
+            row = self._connection().execute(
+                "SELECT data, updated_at FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            pending = row[0]
+        data = json.loads(pending)
+        if data['updated_at'] < time.time() - self.ttl:
+            return None
+        return Session.from_dict(user_id, data)
+
+    def put(self, session):
+        with self._lock:
+            self._pending[session.user_id] = json.dumps(session.to_dict())
+            self._pending.move_to_end(session.user_id)
+            full = len(self._pending) >= self.batch_size
+        if self.flush_interval <= 0:
+            self.flush()
+            return
+        self._ensure_flusher()
+        if full:
+            self._wake.set()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._pending.pop(user_id, None)
+        conn = self._connection()
+        conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        conn.commit()
+
+    def flush(self):
+        """Write pending sessions in one transaction, then enforce TTL and caps"""
+        with self._lock:
+            batch, self._pending = self._pending, OrderedDict()
+        conn = self._connection()
+        if batch:
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions (user_id, data, size, updated_at) VALUES (?, ?, ?, ?)",
+                [(user_id, data, len(data), now) for user_id, data in batch.items()])
+            self.flushes += 1
+        if time.monotonic() - self._last_evict >= self.evict_interval:
+            self._last_evict = time.monotonic()
+            self._evict(conn)
+        conn.commit()
+
+    def _evict(self, conn):
+        expired = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,)).rowcount
+        self.expirations += max(expired, 0)
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+        if count <= self.max_sessions and total <= self.max_bytes:
+            return
+        # Drop least recently updated sessions until both caps hold
+        excess = max(count - self.max_sessions, 0)
+        over = total - self.max_bytes
+        removed = 0
+        for user_id, size in conn.execute("SELECT user_id, size FROM sessions ORDER BY updated_at").fetchall():
+            if removed >= excess and over <= 0:
+                break
+            conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+            removed += 1
+            over -= size
+        self.evictions += removed
+
+    def stats(self):
+        count, total = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'backend': 'sqlite',
+            'sessions': count,
+            'bytes': total,
+            'pending_writes': pending,
+            'flushes': self.flushes,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+def create_session_store(config, default_path):
+    """Build the session store described by the optional 'sessions' config section"""
+    options = dict(config or {})
+    backend = options.pop('backend', 'memory')
+    if backend == 'sqlite':
+        return SQLiteSessionStore(options.pop('path', default_path), **options)
+    if backend == 'memory':
+        options.pop('path', None)
+        return InMemorySessionStore(**options)
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,145 @@
+import logging
+import math
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+
+def haversine_m(lat, lng, lats, lngs):
+    """Great-circle distance in meters from one point to arrays of points"""
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class _GroupIndex:
+    """Places and covered grid cells for one specialist type"""
+
+    __slots__ = ('places', 'place_ids', 'cells', 'covered', 'lats', 'lngs')
+
+    def __init__(self):
+        self.places = []
+        self.place_ids = set()
+        self.cells = {}  # cell -> [place positions]
+        self.covered = set()
+        self.lats = np.empty(0)
+        self.lngs = np.empty(0)
+
+
+class SpatialIndex:
+    """Grid-bucketed index of fetched places, grouped by specialist type
+
+    A cell counts as covered once an upstream search centered within range has
+    been indexed, so nearby queries can be answered locally without another
+    Places call.
+    """
+
+    def __init__(self, cell_deg=0.02, min_coverage=0.75):
+        self.cell_deg = cell_deg
+        self.min_coverage = min_coverage
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def cell_of(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def cell_center(self, lat, lng):
+        row, col = self.cell_of(lat, lng)
+        return ((row + 0.5) * self.cell_deg, (col + 0.5) * self.cell_deg)
+
+    def cells_within(self, lat, lng, radius_m):
+        """Return the cells whose centers lie within radius_m of a point"""
+        dlat = radius_m / METERS_PER_DEGREE
+        dlng = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        row_min, col_min = self.cell_of(lat - dlat, lng - dlng)
+        row_max, col_max = self.cell_of(lat + dlat, lng + dlng)
+        rows, cols = np.meshgrid(np.arange(row_min, row_max + 1), np.arange(col_min, col_max + 1), indexing='ij')
+        rows, cols = rows.ravel(), cols.ravel()
+        distances = haversine_m(lat, lng, (rows + 0.5) * self.cell_deg, (cols + 0.5) * self.cell_deg)
+        inside = distances <= radius_m
+        cells = set(zip(rows[inside].tolist(), cols[inside].tolist()))
+        cells.add(self.cell_of(lat, lng))
+        return cells
+
+    def add(self, group, places):
+        """Index places that carry geometry.location; duplicates by place_id are skipped"""
+        added = 0
+        with self._lock:
+            index = self._groups.setdefault(group, _GroupIndex())
+            new_lats, new_lngs = [], []
+            for place in places:
+                location = (place.get('geometry') or {}).get('location') or {}
+                if 'lat' not in location or 'lng' not in location:
+                    continue
+                place_id = place.get('place_id') or (place.get('name'), location['lat'], location['lng'])
+                if place_id in index.place_ids:
+                    continue
+                index.place_ids.add(place_id)
+                index.cells.setdefault(self.cell_of(location['lat'], location['lng']), []).append(len(index.places))
+                index.places.append(place)
+                new_lats.append(location['lat'])
+                new_lngs.append(location['lng'])
+                added += 1
+            if added:
+                index.lats = np.concatenate([index.lats, new_lats])
+                index.lngs = np.concatenate([index.lngs, new_lngs])
+        return added
+
+    def mark_covered(self, group, lat, lng, radius_m):
+        with self._lock:
+            index = self._groups.setdefault(group, _GroupIndex())
+            index.covered.update(self.cells_within(lat, lng, radius_m))
+
+    def coverage(self, group, lat, lng, radius_m):
+        """Fraction of the cells around a point that have been covered by upstream searches"""
+        cells = self.cells_within(lat, lng, radius_m)
+        with self._lock:
+            index = self._groups.get(group)
+            if index is None:
+                return 0.0
+            return len(cells & index.covered) / len(cells)
+
+    def is_covered(self, group, lat, lng, radius_m):
+        with self._lock:
+            index = self._groups.get(group)
+            if index is None or self.cell_of(lat, lng) not in index.covered:
+                return False
+        return self.coverage(group, lat, lng, radius_m) >= self.min_coverage
+
+    def nearest(self, group, lat, lng, k=1, radius_m=None):
+        """Return up to k (place, distance_m) pairs, nearest first, in one vectorized pass"""
+        with self._lock:
+            index = self._groups.get(group)
+            if index is None or not index.places:
+                return []
+            if radius_m is None:
+                candidates = np.arange(len(index.places))
+            else:
+                positions = [p for cell in self.cells_within(lat, lng, radius_m + self.cell_deg * METERS_PER_DEGREE)
+                             for p in index.cells.get(cell, ())]
+                candidates = np.array(positions, dtype=np.intp)
+            if candidates.size == 0:
+                return []
+            distances = haversine_m(lat, lng, index.lats[candidates], index.lngs[candidates])
+            if radius_m is not None:
+                keep = distances <= radius_m
+                candidates, distances = candidates[keep], distances[keep]
+            if candidates.size > k:
+                top = np.argpartition(distances, k)[:k]
+                candidates, distances = candidates[top], distances[top]
+            order = np.argsort(distances)
+            return [(index.places[candidates[i]], float(distances[i])) for i in order]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'groups': len(self._groups),
+                'places': sum(len(index.places) for index in self._groups.values()),
+                'covered_cells': sum(len(index.covered) for index in self._groups.values()),
+            }
@@ -0,0 +1,303 @@
+import logging
+import re
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Everyday phrasings mapped onto the dataset vocabulary
+SYNONYMS = {
+    'fever': 'high fever',
+    'feverish': 'mild fever',
+    'temperature': 'mild fever',
+    'low grade fever': 'mild fever',
+    'throwing up': 'vomiting',
+    'threw up': 'vomiting',
+    'vomit': 'vomiting',
+    'puking': 'vomiting',
+    'nauseous': 'nausea',
+    'queasy': 'nausea',
+    'tired': 'fatigue',
+    'tiredness': 'fatigue',
+    'exhausted': 'fatigue',
+    'exhaustion': 'fatigue',
+    'dizzy': 'dizziness',
+    'lightheaded': 'dizziness',
+    'light headed': 'dizziness',
+    'vertigo': 'spinning movements',
+    'stomach ache': 'stomach pain',
+    'stomachache': 'stomach pain',
+    'tummy ache': 'stomach pain',
+    'sore throat': 'throat irritation',
+    'scratchy throat': 'throat irritation',
+    'short of breath': 'breathlessness',
+    'shortness of breath': 'breathlessness',
+    'trouble breathing': 'breathlessness',
+    'difficulty breathing': 'breathlessness',
+    'itchy': 'itching',
+    'itch': 'itching',
+    'rash': 'skin rash',
+    'rashes': 'skin rash',
+    'diarrhea': 'diarrhoea',
+    'loose stools': 'diarrhoea',
+    'coughing': 'cough',
+    'sneezing': 'continuous sneezing',
+    'sneezes': 'continuous sneezing',
+    'stuffy nose': 'congestion',
+    'blocked nose': 'congestion',
+    'stuffed up': 'congestion',
+    'blurry vision': 'blurred and distorted vision',
+    'blurred vision': 'blurred and distorted vision',
+    'blurriness': 'blurred and distorted vision',
+    'racing heart': 'fast heart rate',
+    'heart racing': 'fast heart rate',
+    'rapid heartbeat': 'fast heart rate',
+    'heart palpitations': 'palpitations',
+    'frequent urination': 'polyuria',
+    'peeing a lot': 'polyuria',
+    'painful urination': 'burning micturition',
+    'burning when i pee': 'burning micturition',
+    'burning urination': 'burning micturition',
+    'no appetite': 'loss of appetite',
+    'not hungry': 'loss of appetite',
+    'muscle aches': 'muscle pain',
+    'muscle ache': 'muscle pain',
+    'body aches': 'muscle pain',
+    'aching muscles': 'muscle pain',
+    'achy joints': 'joint pain',
+    'sore joints': 'joint pain',
+    'red eyes': 'redness of eyes',
+    'watery eyes': 'watering from eyes',
+    'yellow skin': 'yellowish skin',
+    'jaundice': 'yellowish skin',
+    'yellow eyes': 'yellowing of eyes',
+    'heartburn': 'acidity',
+    'acid reflux': 'acidity',
+    'gas': 'passage of gases',
+    'bloating': 'distention of abdomen',
+    'bloated': 'distention of abdomen',
+    'constipated': 'constipation',
+    'anxious': 'anxiety',
+    'depressed': 'depression',
+    'irritable': 'irritability',
+    'cant concentrate': 'lack of concentration',
+    'trouble concentrating': 'lack of concentration',
+    'sweats': 'sweating',
+    'night sweats': 'sweating',
+    'shaking': 'shivering',
+    'weak': 'muscle weakness',
+    'weakness': 'muscle weakness',
+    'pimples': 'pus filled pimples',
+    'acne': 'pus filled pimples',
+    'lost weight': 'weight loss',
+    'gained weight': 'weight gain',
+    'cramping': 'cramps',
+    'swollen ankles': 'swollen legs',
+    'blood in stool': 'bloody stool',
+    'coughing blood': 'blood in sputum',
+    'coughing up blood': 'blood in sputum',
+    'cant smell': 'loss of smell',
+    'peeling skin': 'skin peeling',
+    'head hurts': 'headache',
+    'stomach hurts': 'stomach pain',
+    'belly hurts': 'belly pain',
+    'chest hurts': 'chest pain',
+    'back hurts': 'back pain',
+    'neck hurts': 'neck pain',
+    'knee hurts': 'knee pain',
+    'joints hurt': 'joint pain',
+}
+
+# Words that carry no symptom content; they are ignored when measuring coverage
+FILLER_WORDS = {
+    'i', 'im', 'ive', 'me', 'my', 'a', 'an', 'the', 'and', 'or', 'but', 'also', 'have', 'has',
+    'had', 'having', 'am', 'is', 'are', 'been', 'be', 'with', 'some', 'really', 'very', 'bit',
+    'little', 'lot', 'of', 'feel', 'feeling', 'felt', 'got', 'getting', 'experiencing', 'suffering',
+    'from', 'it', 'its', 'this', 'that', 'these', 'since', 'for', 'days', 'day', 'week', 'weeks',
+    'yesterday', 'today', 'morning', 'night', 'now', 'too', 'as', 'well', 'kind', 'sort',
+    'severity', 'severe', 'level', 'out', 'pain', 'rate', 'rating', 'discomfort', 'about',
+    'like', 'on', 'in', 'at', 'to', 'bad', 'mild', 'slight', 'constant', 'recently', 'keep',
+    'lately', 'there', 'which', 'would', 'say', 'around',
+}
+
+# Words that deny what follows them, up to the end of the clause
+NEGATIONS = {'no', 'not', 'dont', 'doesnt', 'didnt', 'havent', 'hasnt', 'hadnt', 'isnt', 'arent', 'without',
+             'never', 'nor', 'neither', 'deny', 'denies'}
+CLAUSE_BREAKS = {'and', 'but', 'though', 'although', 'however', 'except'}
+
+SEVERITY_PATTERNS = [
+    re.compile(r'\b(10|[1-9])\s*(?:/|out\s+of)\s*10\b'),
+    re.compile(r'\b(?:severity|pain|discomfort|level|rate|rating|intensity)\D{0,20}?\b(10|[1-9])\b'),
+]
+
+
+def _tokenize(text):
+    return re.findall(r"[a-z0-9]+", text.lower().replace("'", ''))
+
+
+def _scan(text):
+    """Tokens (digits dropped) and, for each, whether it falls within a negation's scope"""
+    tokens, negated = [], []
+    in_scope = False
+    for token in re.findall(r"[a-z0-9]+|[,.;:!?]", text.lower().replace("'", '')):
+        if not token[0].isalnum():
+            in_scope = False
+            continue
+        if token in CLAUSE_BREAKS:
+            in_scope = False
+        if not token.isdigit():
+            tokens.append(token)
+            negated.append(in_scope)
+        if token in NEGATIONS:
+            in_scope = True
+    return tokens, negated
+
+
+def _trigrams(phrase):
+    padded = f"  {phrase} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Extraction:
+    """Result of a local extraction attempt"""
+
+    __slots__ = ('symptoms', 'severity', 'confidence')
+
+    def __init__(self, symptoms, severity, confidence):
+        self.symptoms = symptoms
+        self.severity = severity
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"Extraction(symptoms={self.symptoms!r}, severity={self.severity!r}, confidence={self.confidence:.2f})"
+
+
+class SymptomExtractor:
+    """In-process symptom and severity extractor over the dataset vocabulary
+
+    Phrases are matched exactly (vocabulary plus synonyms, longest first), then
+    leftover words are matched fuzzily through a character-trigram index.
+    Matches that start inside a negation ("no rash", "I don't have a cough")
+    are consumed but not reported. Extractions below the confidence threshold
+    are reported as misses so the caller can fall back to the model; when the
+    model is down, only those above fallback_confidence are used at all.
+    """
+
+    def __init__(self, symptom_index, synonyms=SYNONYMS, min_confidence=0.7, fuzzy_threshold=0.7,
+                 fallback_confidence=0.6):
+        self.min_confidence = min_confidence
+        self.fallback_confidence = fallback_confidence
+        self.fuzzy_threshold = fuzzy_threshold
+
+        self.lexicon = {}  # normalized phrase -> vocabulary symptom
+        for symptom in symptom_index.symptoms:
+            self.lexicon[' '.join(_tokenize(symptom))] = symptom
+        for phrase, symptom in synonyms.items():
+            if symptom not in symptom_index.symptom_ids:
+                logger.warning(f"Ignoring synonym '{phrase}' for unknown symptom '{symptom}'")
+                continue
+            self.lexicon.setdefault(' '.join(_tokenize(phrase)), symptom)
+        self.max_phrase_len = max(len(phrase.split()) for phrase in self.lexicon)
+
+        self.phrases = list(self.lexicon)
+        self.phrase_trigrams = [_trigrams(phrase) for phrase in self.phrases]
+        self.trigram_index = {}
+        for phrase_id, grams in enumerate(self.phrase_trigrams):
+            for gram in grams:
+                self.trigram_index.setdefault(gram, []).append(phrase_id)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def parse_severity(self, text):
+        lowered = text.lower()
+        for pattern in SEVERITY_PATTERNS:
+            match = pattern.search(lowered)
+            if match:
+                return match.group(1)
+        return None
+
+    def fuzzy_match(self, phrase):
+        """Return (symptom, score) for the closest lexicon phrase by trigram Dice similarity"""
+        grams = _trigrams(phrase)
+        shared = Counter()
+        for gram in grams:
+            for phrase_id in self.trigram_index.get(gram, ()):
+                shared[phrase_id] += 1
+        best_id, best_score = None, 0.0
+        for phrase_id, count in shared.items():
+            score = 2 * count / (len(grams) + len(self.phrase_trigrams[phrase_id]))
+            if score > best_score:
+                best_id, best_score = phrase_id, score
+        if best_id is None:
+            return None, 0.0
+        return self.lexicon[self.phrases[best_id]], best_score
+
+    def extract(self, message):
+        """Extract symptoms and a 1-10 severity from a message"""
+        tokens, negated = _scan(message)
+        consumed = [False] * len(tokens)
+        found = []
+        scores = []
+
+        # Exact phrase matches, longest first
+        for n in range(min(self.max_phrase_len, len(tokens)), 0, -1):
+            for start in range(len(tokens) - n + 1):
+                if any(consumed[start:start + n]):
+                    continue
+                phrase = ' '.join(tokens[start:start + n])
+                if phrase in self.lexicon:
+                    if not negated[start]:
+                        found.append(self.lexicon[phrase])
+                        scores.append(1.0)
+                    consumed[start:start + n] = [True] * n
+
+        # Fuzzy matches for the remaining content words (typos, plurals)
+        for n in (2, 1):
+            for start in range(len(tokens) - n + 1):
+                window = tokens[start:start + n]
+                if any(consumed[start:start + n]) or all(token in FILLER_WORDS for token in window):
+                    continue
+                phrase = ' '.join(window)
+                if len(phrase) < 4:
+                    continue
+                symptom, score = self.fuzzy_match(phrase)
+                if symptom and score >= self.fuzzy_threshold:
+                    if not negated[start]:
+                        found.append(symptom)
+                        scores.append(score)
+                    consumed[start:start + n] = [True] * n
+
+        content = [i for i, token in enumerate(tokens) if token not in FILLER_WORDS or consumed[i]]
+        if found and content:
+            coverage = sum(consumed[i] for i in content) / len(content)
+            confidence = coverage * sum(scores) / len(scores)
+        else:
+            confidence = 0.0
+
+        return Extraction(list(dict.fromkeys(found)), self.parse_severity(message), confidence)
+
+    def accept(self, extraction):
+        """Decide whether an extraction can replace the model call, counting the outcome"""
+        confident = extraction.confidence >= self.min_confidence
+        with self._lock:
+            if confident:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return confident
+
+    def usable(self, extraction):
+        """Whether an extraction is good enough to act on when the model is unavailable"""
+        return bool(extraction.symptoms) and extraction.confidence > self.fallback_confidence
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'llm_calls_saved': self.hits,
+            }
@@ -0,0 +1,228 @@
+import argparse
+import csv
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CSV_PATH = os.path.join(os.path.dirname(BACKEND_DIR), 'dataset', 'dataset_with_specialists.csv')
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(BACKEND_DIR), 'dataset', 'symptom_index.bin')
+
+MAGIC = b'LCSYMIX1'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+
+def normalize_symptom(text):
+    """Normalize a dataset token or free-text symptom ("skin_rash", " dischromic _patches")"""
+    text = text.lower().replace('_', ' ')
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def build_index(csv_path=DEFAULT_CSV_PATH, out_path=DEFAULT_INDEX_PATH):
+    """Compile the disease/symptom CSV into a memory-mappable binary artifact
+
+    Layout: magic, uint32 header length, JSON header, then 64-byte aligned
+    arrays described by the header (dtype, shape, offset).
+    """
+    diseases = []
+    disease_ids = {}
+    specialists = []
+    specialist_ids = {}
+    disease_specialist = {}
+    symptoms = []
+    symptom_ids = {}
+    rows = []
+
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)  # header
+        for row in reader:
+            if not row:
+                continue
+            disease = row[0].strip()
+            specialist = row[-1].strip()
+            if disease not in disease_ids:
+                disease_ids[disease] = len(diseases)
+                diseases.append(disease)
+            if specialist not in specialist_ids:
+                specialist_ids[specialist] = len(specialists)
+                specialists.append(specialist)
+            disease_specialist[disease_ids[disease]] = specialist_ids[specialist]
+
+            row_symptoms = set()
+            for token in row[1:-1]:
+                name = normalize_symptom(token)
+                if not name:
+                    continue
+                if name not in symptom_ids:
+                    symptom_ids[name] = len(symptoms)
+                    symptoms.append(name)
+                row_symptoms.add(symptom_ids[name])
+            rows.append((disease_ids[disease], row_symptoms))
+
+    counts = np.zeros((len(diseases), len(symptoms)), dtype=np.uint32)
+    disease_rows = np.zeros(len(diseases), dtype=np.uint32)
+    for disease_id, row_symptoms in rows:
+        disease_rows[disease_id] += 1
+        counts[disease_id, list(row_symptoms)] += 1
+
+    arrays = {
+        'presence': (counts > 0).astype(np.uint8),
+        'frequency': (counts / np.maximum(disease_rows, 1)[:, None]).astype(np.float32),
+        'disease_rows': disease_rows,
+        'disease_specialist': np.array([disease_specialist[i] for i in range(len(diseases))], dtype=np.uint16),
+    }
+
+    header = {
+        'version': FORMAT_VERSION,
+        'source': os.path.basename(csv_path),
+        'symptoms': symptoms,
+        'diseases': diseases,
+        'specialists': specialists,
+        'arrays': {},
+    }
+
+    # Offsets depend on the header size, so repeat the layout until the header is stable
+    offset = 0
+    for _ in range(3):
+        header_bytes = json.dumps(header).encode('utf-8')
+        offset = _align(len(MAGIC) + 4 + len(header_bytes))
+        for name, array in arrays.items():
+            header['arrays'][name] = {
+                'dtype': array.dtype.str,
+                'shape': list(array.shape),
+                'offset': offset,
+            }
+            offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(header['arrays'][name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, out_path)
+
+    logger.info(f"Built symptom index: {len(diseases)} diseases, {len(symptoms)} symptoms, "
+                f"{len(specialists)} specialists -> {out_path}")
+    return out_path
+
+
+class SymptomIndex:
+    """Read-only, memory-mapped view over a compiled symptom index"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a symptom index: {path}")
+        (header_len,) = struct.unpack_from('<I', self._mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self._mmap[start:start + header_len].decode('utf-8'))
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported symptom index version: {header.get('version')}")
+
+        self.symptoms = header['symptoms']
+        self.diseases = header['diseases']
+        self.specialists = header['specialists']
+        self.symptom_ids = {name: i for i, name in enumerate(self.symptoms)}
+        self.symptom_tokens = [frozenset(name.split()) for name in self.symptoms]
+
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=spec['offset'])
+            setattr(self, name, array.reshape(spec['shape']))
+
+    @classmethod
+    def load_or_build(cls, csv_path=DEFAULT_CSV_PATH, path=DEFAULT_INDEX_PATH):
+        """Map the artifact, compiling it first if it is missing or older than the CSV"""
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(csv_path):
+            build_index(csv_path, path)
+        return cls(path)
+
+    def lookup(self, symptoms):
+        """Map free-text symptom names to vocabulary ids
+
+        Names outside the vocabulary map to the single entry whose words best
+        overlap theirs (one word set containing the other). Ambiguous names,
+        such as "pain" or "fever", are left out rather than mapped to several.
+        """
+        ids = []
+        for symptom in symptoms:
+            name = normalize_symptom(symptom)
+            if not name:
+                continue
+            if name in self.symptom_ids:
+                ids.append(self.symptom_ids[name])
+                continue
+            match = self.closest(name)
+            if match is not None:
+                ids.append(match)
+        return list(dict.fromkeys(ids))
+
+    def closest(self, name):
+        """Id of the one vocabulary entry sharing the most whole words with name, or None"""
+        tokens = frozenset(name.split())
+        best_ids, best_score = [], 0.0
+        for term_id, term_tokens in enumerate(self.symptom_tokens):
+            if not (tokens <= term_tokens or term_tokens <= tokens):
+                continue
+            score = len(tokens & term_tokens) / len(tokens | term_tokens)
+            if score > best_score:
+                best_ids, best_score = [term_id], score
+            elif score == best_score:
+                best_ids.append(term_id)
+        return best_ids[0] if len(best_ids) == 1 else None
+
+    def score_diseases(self, symptom_ids):
+        """Score every disease against a set of symptom ids in one vectorized pass"""
+        if not symptom_ids:
+            return np.zeros(len(self.diseases), dtype=np.float32)
+        return self.frequency[:, symptom_ids].sum(axis=1)
+
+    def specialist_name(self, disease_id):
+        return self.specialists[int(self.disease_specialist[disease_id])]
+
+    def rank_specialists(self, symptom_ids):
+        """Return specialists ordered by their best-matching disease score"""
+        scores = self.score_diseases(symptom_ids)
+        best = np.zeros(len(self.specialists), dtype=np.float32)
+        np.maximum.at(best, self.disease_specialist.astype(np.intp), scores)
+        order = np.argsort(-best, kind='stable')
+        return [self.specialists[i] for i in order if best[i] > 0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the symptom/specialist dataset into a binary index")
+    parser.add_argument('--csv', default=DEFAULT_CSV_PATH, help="Source dataset CSV")
+    parser.add_argument('--out', default=DEFAULT_INDEX_PATH, help="Output artifact path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    build_index(args.csv, args.out)
+    index = SymptomIndex(args.out)
+    print(f"{len(index.diseases)} diseases, {len(index.symptoms)} symptoms, "
+          f"{len(index.specialists)} specialists, {os.path.getsize(args.out)} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import threading
+import time
+
+import pytest
+
+import admission
+from admission import AdmissionController, Overloaded
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+class Holder:
+    """Holds one admission slot on a background thread until released"""
+
+    def __init__(self, controller, user_id='holder'):
+        self.release = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(controller, user_id), daemon=True)
+        self.thread.start()
+        wait_for(lambda: controller.stats()['active'] == 1)
+
+    def run(self, controller, user_id):
+        with controller.admit(user_id):
+            self.release.wait(5)
+
+    def done(self):
+        self.release.set()
+        self.thread.join(5)
+
+
+def admit_in_thread(controller, user_id, level, results, hold=0.0):
+    def run():
+        with admission.priority(level):
+            try:
+                with controller.admit(user_id):
+                    results.append(user_id)
+                    time.sleep(hold)
+            except Overloaded as e:
+                results.append((user_id, e.reason))
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_rate_limit_sheds_with_retry_after():
+    controller = AdmissionController(rate=0.5, burst=2)
+    for _ in range(2):
+        with controller.admit('u1'):
+            pass
+    with pytest.raises(Overloaded) as shed:
+        with controller.admit('u1'):
+            pass
+    assert shed.value.reason == 'rate_limited'
+    assert shed.value.retry_after == 2
+    with controller.admit('u2'):
+        pass
+    assert controller.stats()['shed'] == {'rate_limited': 1}
+
+
+def test_batch_work_skips_the_user_bucket():
+    controller = AdmissionController(rate=0.5, burst=1)
+    with admission.priority(admission.BATCH):
+        for _ in range(5):
+            with controller.admit('u1'):
+                pass
+    assert controller.stats()['admitted'] == 5
+
+
+def test_waiters_are_served_interactive_first():
+    controller = AdmissionController(max_concurrent=1, queue_timeout=5, rate=100, burst=100)
+    holder = Holder(controller)
+    order = []
+    threads = [admit_in_thread(controller, 'batch', admission.BATCH, order)]
+    wait_for(lambda: controller.stats()['queue_depth'] == 1)
+    threads.append(admit_in_thread(controller, 'interactive', admission.INTERACTIVE, order))
+    wait_for(lambda: controller.stats()['queue_depth'] == 2)
+
+    holder.done()
+    for thread in threads:
+        thread.join(5)
+    assert order == ['interactive', 'batch']
+
+
+def test_equal_priority_waiters_are_served_earliest_deadline_first():
+    controller = AdmissionController(max_concurrent=1, queue_timeout=5, rate=100, burst=100)
+    holder = Holder(controller)
+    order = []
+    threads = []
+    for user_id in ('first', 'second', 'third'):
+        threads.append(admit_in_thread(controller, user_id, admission.INTERACTIVE, order))
+        wait_for(lambda: controller.stats()['queue_depth'] == len(threads))
+
+    holder.done()
+    for thread in threads:
+        thread.join(5)
+    assert order == ['first', 'second', 'third']
+
+
+def test_interactive_request_preempts_queued_batch_work():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5, rate=100, burst=100)
+    holder = Holder(controller)
+    results = []
+    batch = admit_in_thread(controller, 'batch', admission.BATCH, results)
+    wait_for(lambda: controller.stats()['queue_depth'] == 1)
+    interactive = admit_in_thread(controller, 'interactive', admission.INTERACTIVE, results)
+
+    batch.join(5)
+    assert results == [('batch', 'preempted')]
+    holder.done()
+    interactive.join(5)
+    assert results[-1] == 'interactive'
+    assert controller.stats()['shed'] == {'preempted': 1}
+
+
+def test_full_queue_sheds_work_that_is_not_more_important():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5, rate=100, burst=100)
+    holder = Holder(controller)
+    results = []
+    queued = admit_in_thread(controller, 'queued', admission.INTERACTIVE, results)
+    wait_for(lambda: controller.stats()['queue_depth'] == 1)
+    with pytest.raises(Overloaded) as shed:
+        with controller.admit('late'):
+            pass
+    assert shed.value.reason == 'queue_full'
+    holder.done()
+    queued.join(5)
+    assert results == ['queued']
+
+
+def test_waiter_is_shed_when_its_timeout_passes():
+    controller = AdmissionController(max_concurrent=1, queue_timeout=0.1, rate=100, burst=100)
+    controller._service_time = 0.01  # Short enough that the wait estimate lets the call queue
+    holder = Holder(controller)
+    start = time.monotonic()
+    with pytest.raises(Overloaded) as shed:
+        with controller.admit('u1'):
+            pass
+    assert shed.value.reason == 'timeout'
+    assert 0.1 <= time.monotonic() - start < 1.0
+    assert controller.stats()['queue_depth'] == 0
+    holder.done()
+
+
+def test_call_is_shed_at_once_when_the_estimated_wait_exceeds_the_timeout():
+    controller = AdmissionController(max_concurrent=1, queue_timeout=0.5, rate=100, burst=100)
+    holder = Holder(controller)
+    start = time.monotonic()
+    with pytest.raises(Overloaded) as shed:
+        with controller.admit('u1'):
+            pass
+    assert shed.value.reason == 'deadline'
+    assert time.monotonic() - start < 0.1
+    holder.done()
+
+
+def test_slot_is_released_when_the_call_fails():
+    controller = AdmissionController(max_concurrent=1, rate=100, burst=100)
+    with pytest.raises(RuntimeError):
+        with controller.admit('u1'):
+            raise RuntimeError("model error")
+    assert controller.stats()['active'] == 0
+    with controller.admit('u1'):
+        pass
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+from werkzeug.exceptions import BadRequest, TooManyRequests
+
+import admission
+from batch import BatchRunner
+
+
+@pytest.fixture
+def runner():
+    return BatchRunner(max_workers=4, max_items=10)
+
+
+@pytest.mark.parametrize('items', [
+    [],
+    {'user_id': 'a', 'message': 'hi'},
+    [{'user_id': 'a', 'message': 'hi'}] * 11,
+    [{'user_id': 'a', 'message': 'hi'}, 'hi'],
+    [{'user_id': ['x'], 'message': 'hi'}],
+    [{'user_id': None, 'message': 'hi'}],
+    [{'user_id': 'a'}],
+    [{'user_id': 'a', 'message': ['hi']}],
+])
+def test_malformed_batches_are_rejected_before_running(runner, items):
+    with pytest.raises(BadRequest):
+        runner.validate(items)
+    with pytest.raises(BadRequest):
+        # run() validates on its first step, before any item is processed
+        next(runner.run(items, lambda item: pytest.fail("item processed")))
+
+
+def test_results_cover_every_item_with_per_item_errors(runner):
+    def process(item):
+        if item['message'] == 'fail':
+            raise RuntimeError("model down")
+        if item['message'] == 'shed':
+            raise TooManyRequests()
+        return {'text': item['message'].upper(), 'event_details': None} if item['message'] == 'dict' else item['message']
+
+    items = [
+        {'user_id': 'a', 'message': 'one'},
+        {'message': 'dict'},
+        {'user_id': 'b', 'message': 'fail'},
+        {'user_id': 'c', 'message': 'shed'},
+    ]
+    results = sorted(runner.run(items, process), key=lambda result: result['index'])
+    assert results[0] == {'response': 'one', 'index': 0, 'user_id': 'a'}
+    assert results[1] == {'response': 'DICT', 'event_details': None, 'index': 1, 'user_id': 'default'}
+    assert results[2] == {'error': 'model down', 'status': 500, 'index': 2, 'user_id': 'b'}
+    assert results[3]['status'] == 429 and results[3]['user_id'] == 'c'
+    assert runner.stats() == {'batches': 1, 'items': 4, 'errors': 2}
+
+
+def test_items_for_one_user_run_in_order_at_batch_priority(runner):
+    seen = []
+    lock = threading.Lock()
+
+    def process(item):
+        with lock:
+            seen.append((item['user_id'], item['message'], admission._priority.get()))
+        return item['message']
+
+    items = [{'user_id': user, 'message': str(i)} for i in range(5) for user in ('a', 'b')]
+    assert len(list(runner.run(items, process))) == 10
+    for user in ('a', 'b'):
+        assert [message for who, message, _ in seen if who == user] == [str(i) for i in range(5)]
+    assert {priority for _, _, priority in seen} == {admission.BATCH}
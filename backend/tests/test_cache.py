@@ -0,0 +1,64 @@
+import json
+import time
+
+from cache import TTLCache
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_entries=4, ttl=0.05)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=10)
+    assert cache.get('a') == 1
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert cache.items() == [('b', 2)]
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_deferred_save_batches_writes_and_merges_with_the_file(tmp_path):
+    path = str(tmp_path / 'places_cache.json')
+    other = TTLCache(path=path, save_delay=60)
+    other.set('theirs', 'from another worker')
+    other.flush()
+
+    cache = TTLCache(path=path, save_delay=0.05)
+    other.set('later', 'saved after we loaded')
+    other.flush()
+    for i in range(10):
+        cache.set(f'ours-{i}', i)
+    assert cache.stats()['saves'] == 0
+    deadline = time.monotonic() + 5
+    while cache.stats()['saves'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+
+    assert cache.stats()['saves'] == 1
+    with open(path) as f:
+        stored = json.load(f)
+    assert {key for key in stored} == {'theirs', 'later'} | {f'ours-{i}' for i in range(10)}
+    assert stored['later'][1] == 'saved after we loaded'
+
+
+def test_save_keeps_the_later_expiry_and_drops_expired_entries(tmp_path):
+    path = str(tmp_path / 'places_cache.json')
+    now = time.time()
+    with open(path, 'w') as f:
+        json.dump({'shared': [now + 1000, 'newer'], 'stale': [now - 1, 'expired']}, f)
+    cache = TTLCache(path=path, ttl=10, save_delay=60)
+    assert cache.get('stale') is None
+    cache.set('shared', 'older')
+    cache.flush()
+    with open(path) as f:
+        stored = json.load(f)
+    assert stored == {'shared': [now + 1000, 'newer']}
@@ -0,0 +1,132 @@
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.exceptions import BadRequest
+
+from calendar_service import CalendarService, Event, IntervalIndex, SlotConflict
+
+
+def event(start, end, title='event'):
+    return Event(title, start, end)
+
+
+def overlapping(events, start, end):
+    return [e for e in events if e.start < end and e.end > start]
+
+
+def check_invariants(index):
+    assert index.starts == sorted(index.starts)
+    assert index.starts == [e.start for e in index.events]
+    assert index.max_ends == list(itertools.accumulate((e.end for e in index.events), max))
+
+
+def test_blocked_until_on_an_empty_index():
+    assert IntervalIndex().blocked_until(0, 10) is None
+
+
+def test_blocked_until_treats_ends_as_exclusive():
+    index = IntervalIndex([event(10, 20)])
+    assert index.blocked_until(0, 10) is None
+    assert index.blocked_until(20, 30) is None
+    assert index.blocked_until(15, 16) == 20
+    assert index.blocked_until(0, 11) == 20
+
+
+def test_blocked_until_sees_a_long_event_that_started_earlier():
+    index = IntervalIndex([event(0, 100), event(10, 20), event(30, 40)])
+    assert index.blocked_until(50, 60) == 100
+    assert [e.start for e in index.overlapping(50, 60)] == [0]
+    assert [e.start for e in index.overlapping(15, 35)] == [0, 10, 30]
+
+
+def test_insert_keeps_order_and_running_maximum():
+    index = IntervalIndex()
+    for start, end in [(30, 40), (0, 5), (10, 100), (20, 25), (10, 15)]:
+        index.insert(event(start, end))
+        check_invariants(index)
+    assert index.blocked_until(50, 60) == 100
+    assert index.blocked_until(5, 10) is None
+
+
+def test_remove_recomputes_the_running_maximum():
+    long = event(10, 100)
+    index = IntervalIndex([event(0, 5), long, event(20, 25), event(30, 40)])
+    assert index.blocked_until(50, 60) == 100
+    assert index.remove(long)
+    check_invariants(index)
+    assert index.blocked_until(50, 60) is None
+    assert index.blocked_until(35, 36) == 40
+    assert not index.remove(long)
+
+
+def test_remove_picks_the_right_event_among_equal_starts():
+    first, second = event(10, 20), event(10, 50)
+    index = IntervalIndex([first, second])
+    assert index.remove(second)
+    assert index.events == [first]
+    assert index.blocked_until(30, 40) is None
+
+
+def test_random_inserts_and_removes_match_a_full_scan():
+    rng = random.Random(7)
+    index = IntervalIndex()
+    events = []
+    for _ in range(300):
+        if events and rng.random() < 0.3:
+            removed = events.pop(rng.randrange(len(events)))
+            assert index.remove(removed)
+        else:
+            start = rng.randrange(0, 1000)
+            added = event(start, start + rng.randrange(1, 60))
+            events.append(added)
+            index.insert(added)
+        check_invariants(index)
+        start = rng.randrange(0, 1000)
+        end = start + rng.randrange(1, 60)
+        expected = overlapping(events, start, end)
+        assert index.blocked_until(start, end) == (max(e.end for e in expected) if expected else None)
+        assert {e.id for e in index.overlapping(start, end)} == {e.id for e in expected}
+
+
+def next_weekday_at(hour):
+    day = datetime.now() + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day.replace(hour=hour, minute=0, second=0, microsecond=0).timestamp()
+
+
+def test_add_event_raises_slot_conflict_with_free_suggestions():
+    calendar = CalendarService()
+    start = next_weekday_at(10)
+    calendar.add_event('u1', 'Dentist', start)
+    with pytest.raises(SlotConflict) as conflict:
+        calendar.add_event('u1', 'Checkup', start + 600)
+    assert [e.title for e in conflict.value.conflicts] == ['Dentist']
+    assert conflict.value.suggestions[0] == start + 1800
+    assert len(calendar.events('u1')) == 1
+
+
+def test_add_event_rejects_a_start_in_the_past():
+    with pytest.raises(BadRequest):
+        CalendarService().add_event('u1', 'Checkup', time.time() - 60)
+
+
+def test_free_slots_skip_busy_time_and_closed_hours():
+    calendar = CalendarService(open_hour=9, close_hour=17)
+    start = next_weekday_at(16)
+    calendar.add_event('u1', 'Busy', start, start + 3600)
+    slot = datetime.fromtimestamp(calendar.free_slots('u1', start, count=1)[0])
+    assert slot.hour == 9 and slot.weekday() < 5
+    assert slot.date() > datetime.fromtimestamp(start).date()
+
+
+def test_deleting_an_event_frees_its_slot():
+    calendar = CalendarService()
+    start = next_weekday_at(11)
+    added = calendar.add_event('u1', 'Dentist', start)
+    assert calendar.conflicts_for('u1', start, start + 60)
+    assert calendar.delete_event('u1', added.id) is not None
+    assert calendar.conflicts_for('u1', start, start + 60) == []
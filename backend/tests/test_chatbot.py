@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController
+from chatbot import Chatbot
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for the Gemini model; answers general questions without symptoms"""
+
+    def generate_content(self, prompt, stream=False):
+        text = "Message: Vaccines train your immune system."
+        if stream:
+            return iter([Chunk("Message: Vaccines train "), Chunk("your immune system.")])
+        return Chunk(text)
+
+
+@pytest.fixture
+def chatbot():
+    bot = Chatbot('test-key', 'test-key', admission=AdmissionController(rate=100, burst=100))
+    bot.model = FakeModel()
+    return bot
+
+
+def same_stripe_users(store):
+    by_stripe = {}
+    for i in range(10000):
+        users = by_stripe.setdefault(hash(f"user-{i}") % store.LOCK_STRIPES, [])
+        users.append(f"user-{i}")
+        if len(users) == 2:
+            return users
+    raise AssertionError("no stripe collision found")
+
+
+def greet_while_streaming(chatbot, reader_user, other_user):
+    """Start a stream for reader_user, stall after its first event, and time a greeting from other_user"""
+    events = chatbot.stream_chat_request({'message': 'what is a vaccine?', 'user_id': reader_user})
+    first = next(events)
+    start = time.monotonic()
+    done = threading.Event()
+
+    def greet():
+        chatbot.process_chat_request({'message': 'hello', 'user_id': other_user})
+        done.set()
+
+    threading.Thread(target=greet, daemon=True).start()
+    answered = done.wait(2)
+    waited = time.monotonic() - start
+    rest = list(events)
+    return first, rest, answered, waited
+
+
+def test_stalled_stream_reader_does_not_hold_the_session(chatbot):
+    reader, other = same_stripe_users(chatbot.sessions)
+    first, rest, answered, waited = greet_while_streaming(chatbot, reader, other)
+    assert first['event'] == 'token'
+    assert answered and waited < 0.5
+    assert rest[-1]['event'] == 'done'
+    assert rest[-1]['data']['response'] == "Vaccines train your immune system."
+
+
+def test_cached_reply_stream_does_not_hold_the_session(chatbot):
+    reader, other = same_stripe_users(chatbot.sessions)
+    chatbot.process_chat_request({'message': 'what is a vaccine?', 'user_id': 'warm-up'})
+    first, rest, answered, waited = greet_while_streaming(chatbot, reader, other)
+    assert first == {'event': 'token', 'data': {'text': "Vaccines train your immune system."}}
+    assert answered and waited < 0.5
+
+
+def test_streamed_turn_is_recorded_in_the_session(chatbot):
+    list(chatbot.stream_chat_request({'message': 'what is a vaccine?', 'user_id': 'u1'}))
+    session = chatbot.sessions.get('u1')
+    assert session.turns == [['what is a vaccine?', "Vaccines train your immune system."]]
+
+
+def test_booked_proposal_blocks_the_next_request_for_that_time(chatbot):
+    with chatbot.sessions.transaction('u1') as session:
+        session.last_recommended_doctor = {'name': 'Dr. Example, Clinic', 'address': '1 Main St'}
+    year = time.localtime().tm_year + 1
+    message = f"Schedule an appointment with them for 2:30 PM on 3/15/{year}"
+
+    proposal = chatbot.process_chat_request({'message': message, 'user_id': 'u1'})
+    details = proposal['event_details']
+    assert details == {'title': 'Appointment with Dr. Example', 'date': f'{year}-03-15', 'time': '2:30 PM'}
+
+    # What the client does to confirm: POST /api/calendar with the proposed event
+    event = chatbot.calendar.parse_event(details)
+    chatbot.calendar.add_event('u1', event.title, event.start, event.end, ai_scheduled=True)
+
+    again = chatbot.process_chat_request({'message': message, 'user_id': 'u1'})
+    assert again['event_details'] is None
+    assert "You already have Appointment with Dr. Example" in again['text']
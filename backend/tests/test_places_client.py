@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from places_client import PlacesClient
+from resilience import CallPolicy
+
+
+class PlacesStandIn(ThreadingHTTPServer):
+    """Local text search endpoint that counts requests and can hold them until released"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), PlacesHandler)
+        self.requests = []
+        self.release = threading.Event()
+        self.release.set()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/textsearch/json"
+
+
+class PlacesHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)['query'][0]
+        self.server.requests.append(query)
+        self.server.release.wait(5)
+        body = json.dumps({'status': 'OK', 'results': [{'name': f"{query} clinic"}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = PlacesStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(upstream, **kwargs):
+    return PlacesClient('test-key', url=upstream.url, policy=CallPolicy('places', timeout=5, hedge=False), **kwargs)
+
+
+def test_concurrent_identical_searches_share_one_upstream_call(upstream):
+    client = make_client(upstream)
+    upstream.release.clear()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.text_search({'query': 'cardiologist'})))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while client.stats()['coalesced'] < 7 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    upstream.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert upstream.requests == ['cardiologist']
+    assert results == [[{'name': 'cardiologist clinic'}]] * 8
+    assert client.stats()['coalesced'] == 7
+    # Later lookups are served from the cache
+    assert client.text_search({'query': 'cardiologist'}) == [{'name': 'cardiologist clinic'}]
+    assert upstream.requests == ['cardiologist']
+
+
+def test_different_searches_are_not_coalesced(upstream):
+    client = make_client(upstream)
+    client.text_search({'query': 'cardiologist'})
+    client.text_search({'query': 'dermatologist'})
+    assert sorted(upstream.requests) == ['cardiologist', 'dermatologist']
+    assert client.stats()['coalesced'] == 0
+
+
+def test_expired_entries_are_fetched_again(upstream):
+    client = make_client(upstream, cache_ttl=0.05)
+    client.text_search({'query': 'cardiologist'})
+    client.text_search({'query': 'cardiologist'})
+    time.sleep(0.1)
+    client.text_search({'query': 'cardiologist'})
+    assert upstream.requests == ['cardiologist', 'cardiologist']
@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+
+from resilience import CallPolicy, CircuitBreaker, CircuitOpenError, DeadlineExceeded
+
+
+def fail():
+    raise RuntimeError("upstream error")
+
+
+def test_call_returns_result():
+    policy = CallPolicy('test', timeout=1.0)
+    assert policy.call(lambda a, b=0: a + b, 1, b=2) == 3
+    assert policy.stats()['calls'] == 1
+
+
+def test_deadline_stops_waiting_on_a_slow_call():
+    policy = CallPolicy('test', timeout=0.1, hedge=False)
+    release = threading.Event()
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        policy.call(release.wait, 5)
+    assert time.monotonic() - start < 1.0
+    release.set()
+    stats = policy.stats()
+    assert stats['timeouts'] == 1
+    assert stats['breaker']['consecutive_failures'] == 1
+
+
+def test_errors_are_raised_and_counted():
+    policy = CallPolicy('test', timeout=1.0)
+    with pytest.raises(RuntimeError):
+        policy.call(fail)
+    assert policy.stats()['failures'] == 1
+
+
+def test_no_hedging_until_enough_latencies_are_known():
+    policy = CallPolicy('test', timeout=1.0, min_samples=3)
+    policy.call(lambda: None)
+    assert policy.hedge_delay() is None
+
+
+def test_slow_call_is_hedged_and_the_faster_attempt_wins():
+    policy = CallPolicy('test', timeout=2.0, min_samples=3, min_hedge_delay=0.01)
+    for _ in range(3):
+        policy.call(lambda: None)
+    assert policy.hedge_delay() == pytest.approx(0.01)
+
+    release = threading.Event()
+    attempts = []
+
+    def first_attempt_stalls():
+        attempts.append(1)
+        if len(attempts) == 1:
+            release.wait(2)
+            return 'primary'
+        return 'hedge'
+
+    assert policy.call(first_attempt_stalls) == 'hedge'
+    release.set()
+    stats = policy.stats()
+    assert stats['hedges'] == 1
+    assert stats['hedge_wins'] == 1
+
+
+def test_hedge_delay_stays_within_half_the_deadline():
+    policy = CallPolicy('test', timeout=0.2, min_samples=1)
+    policy.call(time.sleep, 0.15)
+    assert policy.hedge_delay() == pytest.approx(0.1)
+
+
+def test_breaker_opens_after_consecutive_failures_and_rejects_without_calling():
+    policy = CallPolicy('test', timeout=1.0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            policy.call(fail)
+    assert policy.breaker.state == 'open'
+
+    called = []
+    with pytest.raises(CircuitOpenError):
+        policy.call(called.append, 1)
+    with pytest.raises(CircuitOpenError):
+        policy.check_open()
+    assert called == []
+    assert policy.stats()['rejected'] == 2
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.rejecting()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert not breaker.rejecting()  # Checking does not claim the probe
+    assert breaker.state == 'open'
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+    assert breaker.rejecting()
+
+
+def test_successful_probe_closes_the_breaker():
+    policy = CallPolicy('test', timeout=1.0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+    with pytest.raises(RuntimeError):
+        policy.call(fail)
+    time.sleep(0.06)
+    assert policy.call(lambda: 'ok') == 'ok'
+    assert policy.breaker.state == 'closed'
+
+
+def test_failed_probe_reopens_the_breaker():
+    policy = CallPolicy('test', timeout=1.0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+    with pytest.raises(RuntimeError):
+        policy.call(fail)
+    time.sleep(0.06)
+    with pytest.raises(RuntimeError):
+        policy.call(fail)
+    assert policy.breaker.state == 'open'
+    assert policy.breaker.stats()['opens'] == 2
+    with pytest.raises(CircuitOpenError):
+        policy.call(lambda: 'ok')
+
+
+def test_stream_yields_chunks_and_applies_the_deadline():
+    policy = CallPolicy('test', timeout=0.2)
+    assert list(policy.stream(lambda: iter(['a', 'b']))) == ['a', 'b']
+
+    def slow():
+        yield 'a'
+        time.sleep(1)
+        yield 'b'
+
+    chunks = []
+    with pytest.raises(DeadlineExceeded):
+        for chunk in policy.stream(slow):
+            chunks.append(chunk)
+    assert chunks == ['a']
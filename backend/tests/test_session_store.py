@@ -0,0 +1,111 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+def same_stripe_users(store, count=2):
+    by_stripe = {}
+    for i in range(10000):
+        user_id = f"user-{i}"
+        users = by_stripe.setdefault(hash(user_id) % store.LOCK_STRIPES, [])
+        users.append(user_id)
+        if len(users) == count:
+            return users
+    raise AssertionError("no stripe collision found")
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return InMemorySessionStore()
+    return SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+
+
+def test_transaction_saves_changes(store):
+    with store.transaction('u1') as session:
+        session.symptoms = ['cough']
+    assert store.get('u1').symptoms == ['cough']
+
+
+def test_failed_transaction_is_not_saved(store):
+    with pytest.raises(RuntimeError):
+        with store.transaction('u1') as session:
+            session.symptoms = ['cough']
+            raise RuntimeError("turn failed")
+    assert store.get('u1') is None
+
+
+def test_unlocked_block_does_not_hold_up_other_users_on_the_stripe(store):
+    slow_user, other_user = same_stripe_users(store)
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_turn():
+        with store.transaction(slow_user) as session:
+            session.symptoms = ['cough']
+            with store.unlocked():
+                entered.set()
+                release.wait(5)
+            session.severity = '5'
+
+    thread = threading.Thread(target=slow_turn)
+    thread.start()
+    assert entered.wait(5)
+    start = time.monotonic()
+    with store.transaction(other_user) as session:
+        session.symptoms = ['headache']
+    assert time.monotonic() - start < 0.5
+    # What the slow turn did before the block is already saved
+    assert store.get(slow_user).symptoms == ['cough']
+    release.set()
+    thread.join(5)
+    saved = store.get(slow_user)
+    assert (saved.symptoms, saved.severity) == (['cough'], '5')
+
+
+def test_changes_saved_during_an_unlocked_block_are_kept(store):
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_turn():
+        with store.transaction('u1') as session:
+            with store.unlocked():
+                entered.set()
+                release.wait(5)
+            session.severity = '5'
+
+    thread = threading.Thread(target=slow_turn)
+    thread.start()
+    assert entered.wait(5)
+    with store.transaction('u1') as session:
+        session.symptoms = ['headache']
+    release.set()
+    thread.join(5)
+    saved = store.get('u1')
+    assert (saved.symptoms, saved.severity) == (['headache'], '5')
+
+
+def test_unlocked_outside_a_transaction_does_nothing(store):
+    with store.unlocked():
+        pass
+
+
+def append_turns(path, worker, count):
+    store = SQLiteSessionStore(path)
+    for i in range(count):
+        with store.transaction('shared') as session:
+            session.turns = session.turns + [[f"{worker}-{i}", '']]
+
+
+def test_sqlite_transactions_from_several_processes_do_not_lose_updates(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    SQLiteSessionStore(path)
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=append_turns, args=(path, worker, 25)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(30)
+    assert len(SQLiteSessionStore(path).get('shared').turns) == 100
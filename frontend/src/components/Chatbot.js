@@ -119,6 +119,23 @@ function Chatbot() {
         eventDate.setHours(hours, minutes);
       }
 
+      // Book it in the backend calendar first: it rejects times that are taken or have passed
+      try {
+        await axios.post('http://localhost:5003/api/calendar', {
+          user_id: user.uid,
+          title: eventDetails.title,
+          date: eventDetails.date,
+          time: eventDetails.time
+        });
+      } catch (error) {
+        const data = error.response?.data;
+        if (data?.suggestions?.length) {
+          const next = new Date(data.suggestions[0]);
+          throw new Error(`that time is no longer free. The next free slot is ${next.toLocaleString()}`);
+        }
+        throw new Error(data?.error || error.message);
+      }
+
       const eventData = {
         title: eventDetails.title,
         date: Timestamp.fromDate(eventDate),